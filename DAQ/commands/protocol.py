@@ -1,19 +1,44 @@
 # DAQ/commands/protocol.py
 import struct
+from operator import itemgetter
 from DAQ.util.hex import _u, _h
+from DAQ.util.logger import make_logger
+from DAQ.util.macs import MACS, BROADCAST, UNKNOWN
+from DAQ.commands.samples import STATUS, STATUS_LEN, SAMPLE_LEN, FIELDS, SCALE, SampleBatch, sample_values, samples_struct
+
+logger = make_logger("protocol")
 
 command_mapper = {}
+#: command classes indexed by the integer command byte; unknown bytes map to RawResponse
+COMMAND_TABLE = (None,) * 256
 
 
 def safe_int16(val):
     return max(-32768, min(32767, int(val)))
 
+def _picklable(state):
+    # payloads framed from a receive buffer are memoryviews; ship them as bytes
+    return {k: bytes(v) if isinstance(v, memoryview) else v for k, v in state.items()}
+
+def _slotted_state(obj):
+    """Pickle state ``(dict, slots)`` for the __slots__ protocol classes."""
+    slots = {}
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            if hasattr(obj, name):
+                slots[name] = getattr(obj, name)
+    state = getattr(obj, "__dict__", None)
+    return (_picklable(state) if state else None), _picklable(slots)
+
+def _register_command(code, command_class):
+    global COMMAND_TABLE
+    COMMAND_TABLE = COMMAND_TABLE[:code] + (command_class,) + COMMAND_TABLE[code + 1:]
+
 def parse_commands(msg, payload):
     if not payload:
         return []
-    cmd_byte = payload[0:1].hex().upper()  # First byte is command ID
     body = payload[1:]
-    cmd_class = command_mapper.get(cmd_byte, RawResponse)
+    cmd_class = COMMAND_TABLE[payload[0]]  # First byte is command ID
     cmd_instance = cmd_class(header=msg, raw=body)
     cmd_instance.parse(body)
     return [cmd_instance]
@@ -25,10 +50,12 @@ class CommandMeta(type):
         cmd = attrs.get('CMD', None)
         if cmd and name not in ['CommandMeta', 'CommandBase']:
             command_mapper[cmd] = newclass
+            _register_command(int(cmd, 16), newclass)
         return newclass
 
 
 class CommandBase(metaclass=CommandMeta):
+    __slots__ = ("header", "raw")
     CMD = 'FF'
 
     def __init__(self, header=None, raw=b''):
@@ -38,6 +65,9 @@ class CommandBase(metaclass=CommandMeta):
 
     def _init(self): pass
 
+    def __getstate__(self):
+        return _slotted_state(self)
+
     def parse(self, raw=b''):
         if raw:
             self.raw = raw
@@ -63,6 +93,7 @@ class CommandBase(metaclass=CommandMeta):
         }
 
 class RawResponse(CommandBase):
+    __slots__ = ()
     CMD = '00'
 
     def _init(self):
@@ -80,90 +111,117 @@ class RawResponse(CommandBase):
         return res
 
 
+COMMAND_TABLE = tuple(RawResponse if cmd_class is None else cmd_class for cmd_class in COMMAND_TABLE)
+
+
 class DataIndication(CommandBase):
+    """
+    A node's data report. The per-command accessors (data, response(),
+    decompile()) decode the samples once with a single struct unpack and
+    cache them as tuples; ``samples`` builds a SampleBatch from those on
+    first use. Batches of indications are decoded with NumPy in one pass by
+    decode_data_indications() instead.
+    """
+    __slots__ = ("_rows", "_samples", "_parsed", "op_stat", "reg_stat")
     CMD = 'DD'
 
     def _init(self):
-        self.data = []
+        self._rows = None
+        self._samples = None
         self._parsed = False
         self.op_stat = 0
         self.reg_stat = 0
-        print(f"[DEBUG] DataIndication registered as: {command_mapper.get('DD')}")
 
     def parse(self, raw=None):
         if raw is not None:
             self.raw = raw
 
         self._parsed = True
+        self._rows = self._samples = None
         try:
             if len(self.raw) < 4:
                 raise ValueError("Payload too short to contain op_stat and reg_stat")
 
-            self.op_stat, self.reg_stat = struct.unpack(">HH", self.raw[:4])
-            data_raw = self.raw[4:]
-
-            sample_size = 14  # 7 values × 2 bytes each
-            if len(data_raw) % sample_size != 0:
-                print(f"[WARN] Raw payload length {len(data_raw)} not a multiple of {sample_size}")
-
-            for i in range(0, len(data_raw), sample_size):
-                chunk = data_raw[i:i + sample_size]
-                if len(chunk) < sample_size:
-                    continue
-
-                timestamp, Vi, Vo, Ii, Io, Pi, Po = struct.unpack(">Hhhhhhh", chunk)
-                self.data.append({
-                    'timestamp': timestamp,
-                    'Vi': Vi / 100.0,  # ✅ fixed (was /256.0)
-                    'Vo': Vo / 100.0,
-                    'Ii': Ii / 100.0,
-                    'Io': Io / 100.0,
-                    'Pi': Pi / 100.0,
-                    'Po': Po / 100.0
-                })
+            self.op_stat, self.reg_stat = STATUS.unpack_from(self.raw)
+            data_len = len(self.raw) - STATUS_LEN
+
+            if data_len % SAMPLE_LEN != 0:
+                logger.warning(f"[DataIndication] Raw payload length {data_len} not a multiple of {SAMPLE_LEN}")
         except Exception as e:
-            print(f"[DataIndication] parse() error: {e}")
+            logger.warning(f"[DataIndication] parse() error: {e}")
+
+    @property
+    def mac(self):
+        return self.header.mac if self.header else UNKNOWN
+
+    @property
+    def macaddr(self):
+        return self.header.addr if self.header else "unknown"
+
+    def _sample_rows(self):
+        """``(timestamp, Vi .. Po)`` tuples, decoded on first use."""
+        if self._rows is None:
+            region = self.raw[STATUS_LEN:] if self._parsed else b''
+            values = samples_struct(len(region) // SAMPLE_LEN).unpack_from(region) if region else ()
+            self._rows = [(values[i], values[i + 1] / SCALE, values[i + 2] / SCALE, values[i + 3] / SCALE,
+                           values[i + 4] / SCALE, values[i + 5] / SCALE, values[i + 6] / SCALE)
+                          for i in range(0, len(values), len(FIELDS))]
+        return self._rows
+
+    @property
+    def samples(self):
+        """The samples as a SampleBatch, built on first access."""
+        if self._samples is None:
+            self._samples = SampleBatch.from_rows(self.mac, self.op_stat, self.reg_stat, self._sample_rows())
+        return self._samples
+
+    @property
+    def data(self):
+        """
+        Per-sample dicts. A tuple, so code that still appends to it fails
+        loudly; add samples with add_data().
+        """
+        return tuple(dict(zip(FIELDS, row)) for row in self._sample_rows())
 
     def decompile(self):
-        raw = bytearray()
-        raw += struct.pack(">H", getattr(self, "op_stat", 0))
-        raw += struct.pack(">H", getattr(self, "reg_stat", 0))
-
-        for point in self.data:
-            raw += struct.pack(">H", int(point['timestamp']))              # 2 bytes
-            raw += struct.pack(">h", int(point['Vi'] * 100))              # 2 bytes
-            raw += struct.pack(">h", int(point['Vo'] * 100))              # 2 bytes
-            raw += struct.pack(">h", int(point['Ii'] * 100))              # 2 bytes
-            raw += struct.pack(">h", int(point['Io'] * 100))              # 2 bytes
-            raw += struct.pack(">h", safe_int16(point.get('Pi', 0) * 100)) # 2 bytes
-            raw += struct.pack(">h", safe_int16(point.get('Po', 0) * 100)) # 2 bytes
+        values = sample_values(self._sample_rows())
+        count = len(values) // len(FIELDS)
 
+        raw = bytearray(STATUS_LEN + count * SAMPLE_LEN)
+        STATUS.pack_into(raw, 0, self.op_stat, self.reg_stat)
+        samples_struct(count).pack_into(raw, STATUS_LEN, *values)
         return self._wrap(raw)
 
     def response(self):
         return {
             'type': 'mon',
-            'macaddr': self.header.addr if self.header else "unknown",
+            'macaddr': self.macaddr,
             'op_stat': self.op_stat,
             'reg_stat': self.reg_stat,
-            'data': sorted(self.data, key=lambda x: x['timestamp'])
+            'data': [dict(zip(FIELDS, row)) for row in sorted(self._sample_rows(), key=itemgetter(0))]
         }
 
     def add_data(self, timestamp, Vi, Vo, Ii, Io, Pi, Po):
         """Call this to insert one data record (e.g., from emulator)"""
-        self.data.append({
-            'timestamp': int(timestamp),
-            'Vi': round(Vi, 2),
-            'Vo': round(Vo, 2),
-            'Ii': round(Ii, 2),
-            'Io': round(Io, 2),
-            'Pi': round(Pi, 2),
-            'Po': round(Po, 2)
-        })
+        self._sample_rows().append((int(timestamp), round(Vi, 2), round(Vo, 2), round(Ii, 2),
+                                    round(Io, 2), round(Pi, 2), round(Po, 2)))
+        self._samples = None
+
+
+def _ctrl_flag(mask):
+    def get(self):
+        return bool(self.ctrl & mask)
 
+    def set(self, value):
+        self.ctrl = self.ctrl | mask if value else self.ctrl & ~mask
+
+    return property(get, set)
 
 
 class MeshCtrl:
+    """The mesh control byte; flags are read from and written to ``ctrl`` on access."""
+    __slots__ = ("ctrl",)
+
     ATYPE = 0b10000000
     SUPER = 0b01000000
     RREQ  = 0b00100000
@@ -172,20 +230,32 @@ class MeshCtrl:
     TBD1  = 0b00000100
     VER   = 0b00000011
 
+    atype = _ctrl_flag(ATYPE)
+    super = _ctrl_flag(SUPER)
+    rreq  = _ctrl_flag(RREQ)
+    fail  = _ctrl_flag(FAIL)
+    prior = _ctrl_flag(PRIOR)
+    tbd1  = _ctrl_flag(TBD1)
+
     def __init__(self, ctrl=0):
         self.ctrl = ctrl
-        self.atype = bool(ctrl & self.ATYPE)
-        self.super = bool(ctrl & self.SUPER)
-        self.rreq  = bool(ctrl & self.RREQ)
-        self.fail  = bool(ctrl & self.FAIL)
-        self.prior = bool(ctrl & self.PRIOR)
-        self.tbd1  = bool(ctrl & self.TBD1)
-        self.version = ctrl & self.VER
+
+    @property
+    def version(self):
+        return self.ctrl & self.VER
+
+    @version.setter
+    def version(self, value):
+        self.ctrl = (self.ctrl & ~self.VER) | (value & self.VER)
 
     def __int__(self):
         return self.ctrl
 
 class Message:
+    __slots__ = ("mesh_ctrl", "_addr", "_wire", "_mac", "request_id", "source_hopcount", "source_queue_length",
+                 "hopcount", "queue_length", "_reserved", "dtype", "partnum", "numparts",
+                 "payload", "_commands", "raw", "received_on")
+
     MESH_INDICATION = 'MI'
     MESH_INDICATION_FULL = 'MF'
     MESH_MESSAGE = 'MM'
@@ -211,6 +281,9 @@ class Message:
     # defines the chunks of the clarity header, used for parsing.
     LEN_ORDER = (LEN_MESH_CTRL, LEN_ADDR, LEN_REQ_ID,
                  LEN_SHC, LEN_SQL, LEN_HC, LEN_QL, LEN_TYPE, LEN_PART)
+    HEADER_LEN = sum(LEN_ORDER)
+    # ctrl, addr (little-endian), request id, shc, sql, hc, ql, type, parts
+    HEADER = struct.Struct(">B8sHBBBBBB")
 
     TYPE_RES = 0  # reserved bit
     TYPE_SPG = 1
@@ -231,13 +304,65 @@ class Message:
         self.partnum = 1
         self.numparts = 1
         self.payload = b""
-        self.commands = []
+        self._commands = []
         self.raw = b""
         self.received_on = None
 
+    def __getstate__(self):
+        # registry slots are per process; the receiver re-interns from _wire / _addr
+        state, slots = _slotted_state(self)
+        slots["_mac"] = None
+        return state, slots
+
+    @property
+    def addr(self):
+        """The node address as uppercase hex, rendered from the MAC registry on first use."""
+        if self._addr is None:
+            slot = self.mac
+            self._addr = MACS.text(slot) if slot >= 0 else _h(self._wire[::-1])
+        return self._addr
+
+    @addr.setter
+    def addr(self, addr):
+        self._addr = addr
+        self._wire = None
+        self._mac = None
+
+    @property
+    def mac(self):
+        """The node's MAC registry slot; the key for every per-node table."""
+        if self._mac is None:
+            self._mac = MACS.intern(self._wire) if self._wire is not None else MACS.slot(self._addr)
+        return self._mac
+
+    @property
+    def wire(self):
+        """The node address in wire order, as it sits in the header."""
+        if self._wire is None:
+            slot = self.mac
+            self._wire = MACS.wire[slot] if slot >= 0 else MACS.to_wire(self._addr)
+        return self._wire
+
+    @property
+    def commands(self):
+        """The parsed commands; a lazily decoded message parses its payload on first access."""
+        if self._commands is None:
+            self.parse_payload(self.payload)
+        return self._commands
+
+    @commands.setter
+    def commands(self, commands):
+        self._commands = commands
+
+    def is_parsed(self):
+        return self._commands is not None
+
     def set_addr(self, macaddr=None):
         self.addr = macaddr.zfill(self.LEN_ADDR * 2) if macaddr else 'F' * (self.LEN_ADDR * 2)
 
+    def is_broadcast(self):
+        return self.mac == BROADCAST
+
     def add_command(self, cmd):
         cmd.header = self
         self.commands.append(cmd)
@@ -246,44 +371,37 @@ class Message:
         return [cmd.response() for cmd in self.commands]
 
     def decompile(self):
-        raw = bytearray()
-        raw += struct.pack("B", int(self.mesh_ctrl))
-        raw += bytes.fromhex(self.addr)[::-1]
-        raw += struct.pack(">H", self.request_id)
-        raw += struct.pack("B", self.source_hopcount)
-        raw += struct.pack("B", self.source_queue_length)
-        raw += struct.pack("B", self.hopcount)
-        raw += struct.pack("B", self.queue_length)
-        raw += struct.pack("B", (self._reserved << 4) | self.dtype)
-        raw += struct.pack("B", ((self.partnum - 1) << 4) | (self.numparts - 1))
+        raw = bytearray(self.HEADER.pack(
+            int(self.mesh_ctrl), self.wire, self.request_id,
+            self.source_hopcount, self.source_queue_length, self.hopcount, self.queue_length,
+            (self._reserved << 4) | self.dtype, ((self.partnum - 1) << 4) | (self.numparts - 1)))
         for cmd in self.commands:
             raw += cmd.decompile()
         return bytes(raw)
 
+    def _decode_header(self, raw):
+        (ctrl, addr, self.request_id, self.source_hopcount, self.source_queue_length,
+         self.hopcount, self.queue_length, dt, parts) = self.HEADER.unpack_from(raw)
+        self.mesh_ctrl = MeshCtrl(ctrl)
+        self._wire = addr
+        self._addr = None
+        self._mac = None  # interned on first use of .mac
+        self._reserved = dt >> 4
+        self.dtype = dt & 0x0F
+        self.partnum = (parts >> 4) + 1
+        self.numparts = (parts & 0x0F) + 1
+
     @classmethod
     def compile(cls, payload: bytes):
         msg = cls()
-        tokens, remaining = cls.tokenize_string(payload, cls.LEN_ORDER)
-        msg.mesh_ctrl = MeshCtrl(tokens[0][0])
-        msg.addr = _h(tokens[1][::-1])
-        msg.request_id = int.from_bytes(tokens[2], 'big')
-        msg.source_hopcount = tokens[3][0]
-        msg.source_queue_length = tokens[4][0]
-        msg.hopcount = tokens[5][0]
-        msg.queue_length = tokens[6][0]
-        dt = tokens[7][0]
-        msg._reserved = dt >> 4
-        msg.dtype = dt & 0x0F
-        parts = tokens[8][0]
-        msg.partnum = (parts >> 4) + 1
-        msg.numparts = (parts & 0x0F) + 1
+        msg._decode_header(payload)
+        remaining = payload[cls.HEADER_LEN:]
         msg.payload = remaining
 
         try:
             msg.commands = parse_commands(msg, remaining)
         except Exception:
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"[MESSAGE] Could not parse commands from {msg.addr}")
             msg.commands = []
 
         return msg
@@ -298,56 +416,62 @@ class Message:
         return tokens, raw[i:]
 
     @staticmethod
-    def from_raw(message_type, length, raw, received_on):
-        msg = Message()
+    def from_raw(message_type, length, raw, received_on, lazy=False):
+        """
+        Decode a raw frame payload. With ``lazy`` only the fixed header is
+        decoded here; ``commands`` is parsed on first access, so consumers
+        that only need the address, request id or hopcounts never pay for it.
+        """
+        # every slot is assigned below, so skip the defaults in __init__
+        msg = Message.__new__(Message)
         msg.raw = raw
         msg.received_on = received_on
+        msg._decode_header(raw)
+
+        # a single part of a multi-part message is not a whole command
+        # stream; its commands are parsed once the parts are reassembled
+        if msg.is_multipart():
+            msg.payload = memoryview(raw)[Message.HEADER_LEN:]
+            msg._commands = []
+        elif lazy:
+            msg.payload = raw[Message.HEADER_LEN:]
+            msg._commands = None
+        else:
+            msg.parse_payload(raw[Message.HEADER_LEN:])
 
-        tokens, payload = Message.tokenize_string(raw, Message.LEN_ORDER)
-
-        msg.mesh_ctrl = MeshCtrl(tokens[0][0])
-        msg.addr = _h(tokens[1][::-1])
-        msg.request_id = int.from_bytes(tokens[2], 'big')
-        msg.source_hopcount = tokens[3][0]
-        msg.source_queue_length = tokens[4][0]
-        msg.hopcount = tokens[5][0]
-        msg.queue_length = tokens[6][0]
-        dt = tokens[7][0]
-        msg._reserved = dt >> 4
-        msg.dtype = dt & 0x0F
-        parts = tokens[8][0]
-        msg.partnum = (parts >> 4) + 1
-        msg.numparts = (parts & 0x0F) + 1
-
-        msg.payload = payload
-        msg.commands = []
+        return msg
+
+    def is_multipart(self):
+        return self.numparts > 1
+
+    def parse_payload(self, payload):
+        """Parse a complete ``<len><cmd><body>...`` command stream into ``commands``."""
+        self.payload = payload
+        commands = []
+        table = COMMAND_TABLE
 
         try:
-            i = 0
-            while i < len(payload):
+            i, end = 0, len(payload)
+            while i < end:
                 cmd_len = payload[i]
-                if i + 1 + cmd_len > len(payload):
+                cmd_end = i + 1 + cmd_len
+                if cmd_end > end:
                     raise ValueError("Malformed payload: cmd_len exceeds bounds")
 
-                cmd_data = payload[i + 1: i + 1 + cmd_len]
-                cmd_byte = cmd_data[0:1].hex().upper()
-
-                cmd_class = command_mapper.get(cmd_byte, RawResponse)
-                cmd_instance = cmd_class(header=msg, raw=cmd_data[1:])
-                cmd_instance.parse(cmd_data[1:])
-                msg.commands.append(cmd_instance)
+                cmd_class = table[payload[i + 1]] if cmd_len else RawResponse
+                body = payload[i + 2:cmd_end]
+                cmd_instance = cmd_class(header=self, raw=body)
+                cmd_instance.parse(body)
+                commands.append(cmd_instance)
 
-                i += 1 + cmd_len
+                i = cmd_end
 
         except Exception:
-            import traceback
-            traceback.print_exc()
-            msg.commands = []
+            logger.exception(f"[MESSAGE] Could not parse commands from {self.addr}")
+            commands = []
 
-        return msg
+        self.commands = commands
 
     def __repr__(self):
         return f"<Message [{', '.join(repr(c) for c in self.commands)}]>"
 
-print(command_mapper.get('DD'))  # should print <class '...DataIndication'>
-
@@ -0,0 +1,216 @@
+"""
+Bulk decoding of DataIndication samples with NumPy.
+
+A DataIndication body is ``<op_stat:>H> <reg_stat:>H>`` followed by 14-byte
+samples ``>Hhhhhhh`` (timestamp, Vi, Vo, Ii, Io, Pi, Po; electrical values
+in hundredths). decode_samples() joins the sample regions of many frames
+once, decodes them with a single ``numpy.frombuffer`` over a big-endian
+structured dtype and scales the electrical columns with vectorised ops.
+
+SampleBatch carries those columns from the decoder through dispatch to the
+output handlers; per-sample dicts are only built when a consumer asks.
+"""
+
+import struct
+from datetime import datetime, timezone
+from functools import lru_cache
+import numpy as np
+from DAQ.util.macs import MACS, UNKNOWN
+
+STATUS = struct.Struct(">HH")
+STATUS_LEN = STATUS.size
+
+SAMPLE_DTYPE = np.dtype([("timestamp", ">u2"), ("Vi", ">i2"), ("Vo", ">i2"),
+                         ("Ii", ">i2"), ("Io", ">i2"), ("Pi", ">i2"), ("Po", ">i2")])
+SAMPLE_LEN = SAMPLE_DTYPE.itemsize
+FIELDS = SAMPLE_DTYPE.names
+SCALED_FIELDS = FIELDS[1:]
+SCALE = 100.0
+
+# per-sample SampleBatch columns besides mac and freezetime, and the dtype of those not float64
+PACKED = ("timestamp",) + SCALED_FIELDS + ("op_stat", "reg_stat", "hopcount")
+PACKED_DTYPES = {"timestamp": np.int64, "op_stat": np.uint16, "reg_stat": np.uint16, "hopcount": np.uint8}
+
+
+@lru_cache(maxsize=None)
+def samples_struct(count):
+    """One struct for ``count`` consecutive ``>Hhhhhhh`` samples."""
+    return struct.Struct(">" + "Hhhhhhh" * count)
+
+
+def _int16(value):
+    # round, not truncate: 39.11 * 100 is 3910.99..., and decoded samples must re-encode exactly
+    return max(-32768, min(32767, round(value * SCALE)))
+
+
+def sample_values(samples):
+    """Flatten ``(timestamp, Vi, Vo, Ii, Io, Pi, Po)`` tuples into the integers on the wire."""
+    values = []
+    for timestamp, Vi, Vo, Ii, Io, Pi, Po in samples:
+        values += (int(timestamp), _int16(Vi), _int16(Vo), _int16(Ii), _int16(Io), _int16(Pi), _int16(Po))
+    return values
+
+
+def utc_datetime(epoch):
+    """A timezone-aware UTC datetime for a float epoch (None stays None)."""
+    return None if epoch is None else datetime.fromtimestamp(epoch, timezone.utc)
+
+
+def _whole_samples(region):
+    return region[:len(region) - len(region) % SAMPLE_LEN]
+
+
+def decode_samples(regions, macs=None):
+    """
+    Decode the sample regions of many frames in one pass.
+
+    Returns a dict of column arrays: ``timestamp`` (int64) and ``Vi`` ..
+    ``Po`` (float64, already scaled), plus ``frame``, the index of the region
+    each sample came from. When ``macs`` (one per region) is given it is
+    returned under ``macs`` so ``macs[frame[i]]`` names the node of sample i.
+    A trailing partial sample in a region is ignored.
+    """
+    regions = [_whole_samples(region) for region in regions]
+    counts = np.fromiter((len(region) // SAMPLE_LEN for region in regions), dtype=np.intp, count=len(regions))
+    samples = np.frombuffer(b"".join(regions), dtype=SAMPLE_DTYPE)
+
+    columns = {"frame": np.repeat(np.arange(len(regions), dtype=np.intp), counts),
+               "timestamp": samples["timestamp"].astype(np.int64)}
+    for name in SCALED_FIELDS:
+        columns[name] = samples[name] / SCALE
+    if macs is not None:
+        columns["macs"] = list(macs)
+    return columns
+
+
+def decode_data_indications(commands):
+    """
+    Decode the samples of many parsed DataIndications into one SampleBatch;
+    each command contributes its node's MAC slot, hopcount and op_stat/reg_stat.
+    """
+    regions, macs, op_stat, reg_stat, hopcount = [], [], [], [], []
+    for cmd in commands:
+        header = cmd.header
+        regions.append(cmd.raw[STATUS_LEN:])
+        macs.append(header.mac if header is not None else UNKNOWN)
+        hopcount.append(header.hopcount if header is not None else 0)
+        op_stat.append(cmd.op_stat)
+        reg_stat.append(cmd.reg_stat)
+    return SampleBatch.decode(regions, macs, op_stat, reg_stat, hopcount)
+
+
+class SampleBatch:
+    """
+    Columnar DataIndication samples.
+
+    ``mac`` (the node's MAC registry slot), ``timestamp`` (seconds since
+    sunrise, as the node counts them), ``Vi`` .. ``Po`` (scaled), ``op_stat``,
+    ``reg_stat`` and ``hopcount`` (of the frame the sample arrived in) are one
+    array entry per sample. DAQProcess stamps ``freezetime`` (per-sample UTC
+    epochs resolved from ``timestamp``) and ``localtime`` (the epoch the batch
+    was received) before the batch is handed to the output handlers.
+    """
+    __slots__ = ("mac", "timestamp", "Vi", "Vo", "Ii", "Io", "Pi", "Po",
+                 "op_stat", "reg_stat", "hopcount", "type", "freezetime", "localtime")
+
+    def __init__(self, mac, timestamp, values, op_stat, reg_stat, type='mon', hopcount=None):
+        self.mac = mac
+        self.timestamp = timestamp
+        for name in SCALED_FIELDS:
+            setattr(self, name, values[name])
+        self.op_stat = op_stat
+        self.reg_stat = reg_stat
+        self.hopcount = np.zeros(len(timestamp), dtype=np.uint8) if hopcount is None else hopcount
+        self.type = type
+        self.freezetime = None
+        self.localtime = None
+
+    @classmethod
+    def decode(cls, regions, macs, op_stat, reg_stat, hopcount=None):
+        """One batch from the sample regions of many frames and their per-frame MAC slot, status and hopcount."""
+        columns = decode_samples(regions)
+        frame = columns["frame"]
+        if hopcount is not None:
+            hopcount = np.asarray(hopcount, dtype=np.uint8)[frame]
+        return cls(np.asarray(macs, dtype=np.intp)[frame], columns["timestamp"], columns,
+                   np.asarray(op_stat, dtype=np.uint16)[frame],
+                   np.asarray(reg_stat, dtype=np.uint16)[frame], hopcount=hopcount)
+
+    @classmethod
+    def from_rows(cls, mac, op_stat, reg_stat, rows):
+        """A single-node batch from ``(timestamp, Vi, Vo, Ii, Io, Pi, Po)`` tuples."""
+        table = np.array(rows, dtype=np.float64).reshape(-1, len(FIELDS))
+        n = len(table)
+        values = {name: table[:, i + 1] for i, name in enumerate(SCALED_FIELDS)}
+        return cls(np.full(n, mac, dtype=np.intp), table[:, 0].astype(np.int64), values,
+                   np.full(n, op_stat, dtype=np.uint16), np.full(n, reg_stat, dtype=np.uint16))
+
+    def __getstate__(self):
+        # MAC slots are per process: ship the wire address behind each slot used.
+        # Every per-sample column fits a float64 exactly, so they travel as one
+        # array; pickling an array costs more than a small batch's samples do
+        macs = self.mac.tolist()
+        slots = list(dict.fromkeys(macs))
+        position = {slot: i for i, slot in enumerate(slots)}
+        columns = [[position[slot] for slot in macs]] + [getattr(self, name) for name in PACKED]
+        if self.freezetime is not None:
+            columns.append(self.freezetime)
+        wire = [None if slot < 0 else MACS.wire[slot] for slot in slots]
+        return np.array(columns, dtype=np.float64), wire, self.type, self.localtime
+
+    def __setstate__(self, state):
+        packed, wire, self.type, self.localtime = state
+        slots = np.array([UNKNOWN if addr is None else MACS.intern(addr) for addr in wire], dtype=np.intp)
+        self.mac = slots[packed[0].astype(np.intp)]
+        for name, column in zip(PACKED, packed[1:]):
+            setattr(self, name, column.astype(PACKED_DTYPES.get(name, np.float64)))
+        self.freezetime = packed[-1] if len(packed) > len(PACKED) + 1 else None
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def take(self, index):
+        """A new batch holding the samples at ``index``."""
+        batch = SampleBatch(self.mac[index], self.timestamp[index],
+                            {name: getattr(self, name)[index] for name in SCALED_FIELDS},
+                            self.op_stat[index], self.reg_stat[index], self.type, self.hopcount[index])
+        if self.freezetime is not None:
+            batch.freezetime = self.freezetime[index]
+        batch.localtime = self.localtime
+        return batch
+
+    def sorted(self):
+        """
+        The batch with each node's samples ordered by timestamp (stable), and
+        the nodes in the order they first appear; ``self`` when it already is.
+        """
+        if len(self) < 2 or not (np.diff(self.timestamp) < 0).any():
+            return self
+        _, first, inverse = np.unique(self.mac, return_index=True, return_inverse=True)
+        return self.take(np.lexsort((self.timestamp, first[inverse])))
+
+    def tuples(self):
+        """Per-sample ``(timestamp, Vi, Vo, Ii, Io, Pi, Po)`` tuples."""
+        return list(zip(self.timestamp.tolist(), *(getattr(self, name).tolist() for name in SCALED_FIELDS)))
+
+    def rows(self):
+        """Per-sample ``{timestamp, Vi .. Po}`` dicts, as DataIndication.data has always held them."""
+        return [dict(zip(FIELDS, values)) for values in self.tuples()]
+
+    def payloads(self):
+        """
+        The per-sample data report dicts the BSON handler publishes. The
+        epochs become UTC datetimes here, on the way out, so the published
+        records keep the BSON dates they have always carried.
+        """
+        localtime, kind = utc_datetime(self.localtime), self.type
+        text = MACS.text
+        columns = [self.mac.tolist(), self.freezetime.tolist(), self.op_stat.tolist(), self.reg_stat.tolist()]
+        columns += [getattr(self, name).tolist() for name in SCALED_FIELDS]
+        return [dict(type=kind, macaddr=text(mac), freezetime=utc_datetime(freezetime),
+                     localtime=localtime, reg_stat=reg_stat, op_stat=op_stat,
+                     Vi=Vi, Vo=Vo, Ii=Ii, Io=Io, Pi=Pi, Po=Po)
+                for mac, freezetime, op_stat, reg_stat, Vi, Vo, Ii, Io, Pi, Po in zip(*columns)]
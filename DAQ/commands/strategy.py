@@ -117,7 +117,7 @@ class MeshCommands:
         msg.set_addr(macaddr)
         msg.request_id = request_id
         msg.mesh_ctrl.rreq = rreq if rreq is not None else not msg.is_broadcast()
-        msg.mesh_ctrl.priority = True
+        msg.mesh_ctrl.prior = True
 
         for cmd in commands:
             msg.add_command(cmd)
@@ -0,0 +1,311 @@
+"""
+Multi-process gateway acceptors.
+
+With ``gateway.acceptors: N`` (N > 1) start_gateway_servers spawns N acceptor
+processes that each bind comm_port with SO_REUSEPORT, so the kernel spreads
+gateway connections across cores. Each acceptor frames and decodes locally
+and forwards decoded batches to the DAQ core over a one-way pipe; the core
+watches the pipes from its event loop and feeds recv_queue. The UDP
+autodiscovery responder stays a single instance in the core.
+
+Envelopes decode lazily, but an acceptor parses their commands before
+pickling a batch, so command parsing stays spread across the acceptors
+rather than falling back onto the single DAQ core.
+
+Backpressure crosses the pipe: when recv_queue pauses its producers the core
+stops reading the pipe, the acceptor's forwarder blocks, its local queue
+fills and it pauses its own gateway transports.
+
+Downlink frames travel the other way over a second pipe per acceptor. The
+core queues them without blocking and forwards whatever is pending as one
+record; the acceptor hands them to its own DAQ.gateway.downlink writers, so
+pacing and coalescing still happen per gateway connection. The core does not
+know which acceptor holds a gateway, so a unicast frame goes to all of them
+and each acknowledges whether it had the gateway. When every live acceptor
+reports a miss, the core floods the frame, as the single-process
+GatewayManager.send_unicast does.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+from DAQ.lib.encoding import encode_obj, decode_obj
+from DAQ.util.logger import make_logger
+from DAQ.gateway.ingest import IngestEnvelope, IngestQueue
+
+logger = make_logger("acceptors")
+
+STATS_EVERY = 5
+
+
+def acceptor_entrypoint(index, conn, down_conn):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        asyncio.run(_acceptor_main(index, conn, down_conn))
+    except (BrokenPipeError, EOFError, asyncio.CancelledError):
+        pass
+
+
+def _parse_commands(batch):
+    """Parse the commands of every envelope in a batch, so they cross the pipe already decoded."""
+    for item in batch:
+        if isinstance(item, list):
+            _parse_commands(item)
+        elif isinstance(item, IngestEnvelope):
+            item.commands
+
+
+def _on_downlink(down_conn, acks, acks_ready, main):
+    from DAQ.gateway import downlink
+
+    # poll() only says a message has started to arrive; recv_bytes() then
+    # waits for the rest. The core writes each record whole from an executor
+    # thread, so that wait is one pipe copy, never the core's event loop.
+    try:
+        while down_conn.poll():
+            for gwid, frame, seq in decode_obj(down_conn.recv_bytes()):
+                if gwid is None:
+                    downlink.broadcast(frame)
+                else:
+                    acks.append((seq, downlink.send_to(gwid, frame)))
+                    acks_ready.set()
+    except (EOFError, OSError):
+        # the core closed the pipe: it is shutting down or has given up on us
+        asyncio.get_running_loop().remove_reader(down_conn.fileno())
+        main.cancel()
+
+
+async def _acceptor_main(index, conn, down_conn):
+    from DAQ.gateway.server import start_tcp_server, batch_max, acceptor_qsize
+    from DAQ.gateway.framing import link_quality
+    from DAQ.gateway.downlink import downlink_stats
+    from DAQ.gateway.dedupe import dedupe_stats
+
+    local_queue = IngestQueue(acceptor_qsize)
+    server = await start_tcp_server(local_queue, reuse_port=True)
+    loop = asyncio.get_running_loop()
+
+    # batches, stats and downlink acks share the pipe; one writer at a time
+    send_lock = asyncio.Lock()
+
+    async def send(record):
+        async with send_lock:
+            await loop.run_in_executor(None, conn.send_bytes, encode_obj(record))
+
+    acks, acks_ready = deque(), asyncio.Event()
+
+    async def forward_acks():
+        while True:
+            await acks_ready.wait()
+            acks_ready.clear()
+            records = list(acks)
+            acks.clear()
+            await send(("acks", records))
+
+    ack_task = loop.create_task(forward_acks())
+    loop.add_reader(down_conn.fileno(), _on_downlink, down_conn, acks, acks_ready, asyncio.current_task())
+    logger.info(f"[ACCEPTOR {index}] PID {os.getpid()} accepting gateway connections")
+
+    last_stats = time.monotonic()
+    try:
+        while True:
+            batch = await local_queue.get_batch(batch_max)
+            _parse_commands(batch)
+            await send(("batch", batch))
+
+            if time.monotonic() - last_stats >= STATS_EVERY:
+                last_stats = time.monotonic()
+                await send(("stats", dict(link_quality(), downlink=downlink_stats(), dedupe=dedupe_stats())))
+    finally:
+        ack_task.cancel()
+        loop.remove_reader(down_conn.fileno())
+        server.close()
+        conn.close()
+        down_conn.close()
+
+
+class AcceptorLink:
+    """
+    Core-side end of one acceptor pipe. Quacks like a transport
+    (pause_reading/resume_reading/is_closing) so IngestQueue can apply the
+    pause policy to it.
+    """
+
+    def __init__(self, index, conn, down_conn, recv_queue, loop, pool=None):
+        self.index = index
+        self.conn = conn
+        self.down_conn = down_conn
+        self.recv_queue = recv_queue
+        self.loop = loop
+        self.pool = pool
+        self.paused = True
+        self.closed = False
+        self.stats = {}
+
+        self.downlink = deque()
+        self._downlink_wake = asyncio.Event()
+        self._downlink_task = loop.create_task(self._forward_downlink())
+
+    def pause_reading(self):
+        if not self.paused and not self.closed:
+            self.loop.remove_reader(self.conn.fileno())
+        self.paused = True
+
+    def resume_reading(self):
+        if self.paused and not self.closed:
+            self.loop.add_reader(self.conn.fileno(), self._on_readable)
+        self.paused = False
+
+    def is_closing(self):
+        return self.closed
+
+    def _on_readable(self):
+        # recv_bytes() may wait for the rest of a message poll() saw start;
+        # the acceptor writes each record whole from an executor thread, so
+        # that is one pipe copy of at most a recv_queue batch
+        try:
+            while not self.paused and self.conn.poll():
+                kind, payload = decode_obj(self.conn.recv_bytes())
+                if kind == "batch":
+                    self.recv_queue.offer(payload)
+                elif kind == "acks":
+                    for seq, sent in payload:
+                        self.pool.downlink_ack(seq, self.index, sent)
+                elif kind == "stats":
+                    self.stats = payload
+        except (EOFError, OSError):
+            logger.warning(f"[ACCEPTOR {self.index}] Pipe closed")
+            self.close()
+
+    def queue_downlink(self, gwid, frame, seq=None):
+        """Queue a frame for the acceptor's gateways (``gwid=None`` for all of them); ``seq`` numbers unicasts."""
+        self.downlink.append((gwid, frame, seq))
+        self._downlink_wake.set()
+
+    async def _forward_downlink(self):
+        try:
+            while True:
+                await self._downlink_wake.wait()
+                self._downlink_wake.clear()
+                records, self.downlink = list(self.downlink), deque()
+                await self.loop.run_in_executor(None, self.down_conn.send_bytes, encode_obj(records))
+        except (BrokenPipeError, OSError):
+            logger.warning(f"[ACCEPTOR {self.index}] Downlink pipe closed")
+
+    def close(self):
+        if not self.closed:
+            self.pause_reading()
+            self.closed = True
+            self._downlink_task.cancel()
+            self.recv_queue.unregister(self)
+            self.conn.close()
+            self.down_conn.close()
+            if self.pool is not None:
+                self.pool.abandon(self.index)
+
+
+class AcceptorPool:
+    """Spawns and supervises the acceptor processes; closes like an asyncio.Server."""
+
+    def __init__(self, recv_queue: IngestQueue, count: int):
+        self.recv_queue = recv_queue
+        self.count = count
+        self.processes = []
+        self.links = []
+
+        self.sequence = 0
+        self.unicasts = {}  # seq -> (frame, acceptors yet to answer, on_miss)
+        self.counters = dict(unicast=0, delivered=0, flooded=0)
+
+    async def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        loop = asyncio.get_running_loop()
+
+        for index in range(self.count):
+            reader, writer = ctx.Pipe(duplex=False)
+            down_reader, down_writer = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=acceptor_entrypoint, args=(index, writer, down_reader),
+                               name=f"GatewayAcceptor-{index}", daemon=True)
+            proc.start()
+            writer.close()
+            down_reader.close()
+
+            link = AcceptorLink(index, reader, down_writer, self.recv_queue, loop, self)
+            link.resume_reading()
+            self.recv_queue.register(link)
+
+            self.processes.append(proc)
+            self.links.append(link)
+            logger.info(f"[ACCEPTOR {index}] Started PID {proc.pid}")
+
+    def link_stats(self):
+        return {link.index: link.stats for link in self.links}
+
+    def unicast_stats(self):
+        return dict(self.counters, pending=len(self.unicasts))
+
+    def broadcast(self, frame):
+        """Fan a downlink frame out to every acceptor; returns how many were reached."""
+        for link in self.links:
+            if not link.closed:
+                link.queue_downlink(None, frame)
+        return sum(not link.closed for link in self.links)
+
+    def send_to(self, gwid, frame, on_miss=None):
+        """
+        Queue a downlink frame for one gateway on whichever acceptor holds it.
+        If none does, the frame is flooded once every acceptor has reported
+        the miss, and ``on_miss()`` is called.
+        """
+        live = [link for link in self.links if not link.closed]
+        if not live:
+            return 0
+
+        self.sequence += 1
+        self.unicasts[self.sequence] = (frame, {link.index for link in live}, on_miss)
+        self.counters["unicast"] += 1
+        for link in live:
+            link.queue_downlink(gwid, frame, self.sequence)
+        return 1
+
+    def downlink_ack(self, seq, index, sent):
+        pending = self.unicasts.get(seq)
+        if pending is None:
+            return
+        frame, waiting, on_miss = pending
+        if sent:
+            del self.unicasts[seq]
+            self.counters["delivered"] += 1
+            return
+
+        waiting.discard(index)
+        if not waiting:
+            del self.unicasts[seq]
+            self.counters["flooded"] += 1
+            logger.debug(f"[DOWNLINK] No acceptor holds the routed gateway; flooding unicast {seq}")
+            self.broadcast(frame)
+            if on_miss is not None:
+                on_miss()
+
+    def abandon(self, index):
+        """An acceptor went away: count it as a miss for every unicast it had not answered."""
+        for seq in [seq for seq, (_, waiting, _) in self.unicasts.items() if index in waiting]:
+            self.downlink_ack(seq, index, False)
+
+    def close(self):
+        self.unicasts = {}  # shutting down: nothing left to flood to
+        for link in self.links:
+            link.close()
+        for proc in self.processes:
+            if proc.is_alive():
+                proc.terminate()
+
+    async def wait_closed(self):
+        loop = asyncio.get_running_loop()
+        for proc in self.processes:
+            await loop.run_in_executor(None, proc.join, 5)
+        self.processes = []
+        self.links = []
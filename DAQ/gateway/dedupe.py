@@ -0,0 +1,96 @@
+"""
+Suppression of retransmitted mesh frames.
+
+Frames are fingerprinted right after framing, before they are decoded: the
+node address and request id straight from the header bytes plus a CRC-32 of
+the command payload. Hop and queue counters are left out, so a
+retransmission that took another route still matches.
+
+Fingerprints live in two rotating generations. A new generation starts
+every ``gateway.dedupe_window / 2`` seconds, or sooner once it holds
+``gateway.dedupe_capacity`` entries, and the oldest one is dropped. A
+fingerprint is therefore remembered for between half and the whole window,
+and the filter never holds more than ``2 * dedupe_capacity`` of them.
+``gateway.dedupe_window: 0`` disables the filter.
+
+Per-node counts are kept for nodes already in the MAC registry; frames
+from addresses not interned yet count under ``unknown``.
+
+In acceptor mode each acceptor process filters its own connections.
+"""
+
+import time
+import zlib
+from DAQ.util.config import load_config
+from DAQ.util.macs import MACS, UNKNOWN_TEXT
+from DAQ.commands.protocol import Message
+
+cfg = load_config()
+
+dedupe_window = cfg["gateway"].get("dedupe_window", 30.0)
+dedupe_capacity = cfg["gateway"].get("dedupe_capacity", 65536)
+
+_ADDR = slice(1, 1 + Message.LEN_ADDR)
+_ADDR_REQ = slice(1, 1 + Message.LEN_ADDR + Message.LEN_REQ_ID)
+
+
+class DuplicateFilter:
+    def __init__(self, window=30.0, capacity=65536, clock=time.monotonic):
+        self.period = window / 2
+        self.capacity = capacity
+        self.clock = clock
+        self.current = set()
+        self.previous = set()
+        self.rotated = clock()
+
+        self.frames = 0
+        self.duplicates = 0
+        self.nodes = {}  # MAC slot -> [frames, duplicates]
+
+    def seen(self, raw):
+        """Record a frame payload; returns True if it duplicates a recent one."""
+        now = self.clock()
+        if now - self.rotated >= self.period or len(self.current) >= self.capacity:
+            self.previous, self.current = self.current, set()
+            self.rotated = now
+
+        key = int.from_bytes(raw[_ADDR_REQ], "big") << 32 | zlib.crc32(raw[Message.HEADER_LEN:])
+
+        # the header is not validated yet: count against a known node, never intern
+        addr = MACS.lookup(raw[_ADDR])
+        node = self.nodes.get(addr)
+        if node is None:
+            node = self.nodes[addr] = [0, 0]
+        node[0] += 1
+        self.frames += 1
+
+        if key in self.current or key in self.previous:
+            node[1] += 1
+            self.duplicates += 1
+            return True
+
+        self.current.add(key)
+        return False
+
+    def clear(self):
+        self.current.clear()
+        self.previous.clear()
+        self.rotated = self.clock()
+
+    def stats(self):
+        """Duplicate counts and rate, overall and per node MAC."""
+        nodes = {}
+        for addr, (frames, duplicates) in list(self.nodes.items()):
+            name = MACS.text(addr).decode() if addr >= 0 else UNKNOWN_TEXT
+            nodes[name] = dict(frames=frames, duplicates=duplicates, rate=duplicates / frames)
+        return dict(frames=self.frames, duplicates=self.duplicates,
+                    rate=self.duplicates / self.frames if self.frames else 0.0,
+                    fingerprints=len(self.current) + len(self.previous), nodes=nodes)
+
+
+#: process-wide filter shared by every gateway connection (None when disabled)
+DEDUPE = DuplicateFilter(dedupe_window, dedupe_capacity) if dedupe_window > 0 else None
+
+
+def dedupe_stats():
+    return DEDUPE.stats() if DEDUPE is not None else {}
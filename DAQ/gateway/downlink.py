@@ -0,0 +1,153 @@
+"""
+Downlink path from the DAQ core to the connected gateways.
+
+Every gateway connection gets a DownlinkWriter with its own outbound queue.
+Its writer task coalesces whatever is pending into a single
+``transport.writelines`` call and paces traffic with a per-gateway token
+bucket (``1 / gateway.packet_delay`` frames per second, bursts of up to
+``gateway.packet_batch``). Queuing never awaits, so broadcast fan-out from
+the DAQ loop does not block ingest.
+"""
+
+import asyncio
+import time
+from collections import deque
+from DAQ.util.logger import make_logger
+from DAQ.util.config import load_config
+from DAQ.commands.strategy import PACKET_DELAY
+from DAQ.gateway.encoder import FrameEncoder
+
+logger = make_logger("downlink")
+cfg = load_config()
+
+packet_delay = cfg["gateway"].get("packet_delay", PACKET_DELAY)
+packet_batch = cfg["gateway"].get("packet_batch", 10)
+downlink_max_pending = cfg["gateway"].get("downlink_max_pending", 1024)
+downlink_max_buffer = cfg["gateway"].get("downlink_max_buffer", 64 * 1024)
+frame_crc = cfg["gateway"].get("frame_crc", False)
+
+_encoder = FrameEncoder(with_crc=frame_crc)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, wanted):
+        """Take up to ``wanted`` whole tokens; returns how many were granted."""
+        self._refill()
+        granted = min(wanted, int(self.tokens))
+        self.tokens -= granted
+        return granted
+
+    def wait_time(self):
+        self._refill()
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+
+class DownlinkWriter:
+    def __init__(self, gwid, transport, rate, burst, max_pending=1024, max_buffer=64 * 1024):
+        self.gwid = gwid
+        self.transport = transport
+        self.bucket = TokenBucket(rate, burst)
+        self.max_pending = max_pending
+        self.max_buffer = max_buffer
+        self.pending = deque()
+        self.task = None
+        self._wake = asyncio.Event()
+
+        self.frames_sent = 0
+        self.writes = 0
+        self.dropped = 0
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def enqueue(self, frame):
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append(frame)
+        self._wake.set()
+
+    def stats(self):
+        return dict(pending=len(self.pending), frames_sent=self.frames_sent,
+                    writes=self.writes, dropped=self.dropped)
+
+    async def _run(self):
+        pending, bucket, transport = self.pending, self.bucket, self.transport
+
+        while not transport.is_closing():
+            if not pending:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            if transport.get_write_buffer_size() > self.max_buffer:
+                await asyncio.sleep(1.0 / bucket.rate)
+                continue
+
+            count = bucket.take(len(pending))
+            if not count:
+                await asyncio.sleep(bucket.wait_time())
+                continue
+
+            frames = [pending.popleft() for _ in range(count)]
+            transport.writelines(frames)
+            self.frames_sent += count
+            self.writes += 1
+
+
+#: connected gateways, keyed by gateway id
+GATEWAYS = {}
+
+
+def attach(gwid, transport):
+    writer = DownlinkWriter(gwid, transport, 1.0 / packet_delay, packet_batch,
+                            downlink_max_pending, downlink_max_buffer)
+    writer.start()
+    GATEWAYS[gwid] = writer
+    return writer
+
+
+def detach(gwid):
+    writer = GATEWAYS.pop(gwid, None)
+    if writer is not None:
+        writer.close()
+
+
+def encode_message(msg_type, message):
+    """Frame a whole Message as ``<msg_type><len><payload>[crc]`` through the shared FrameEncoder."""
+    return _encoder.encode_message(message, header=msg_type.encode())
+
+
+def broadcast(frame):
+    """Queue an encoded frame on every connected gateway; returns how many."""
+    for writer in GATEWAYS.values():
+        writer.enqueue(frame)
+    return len(GATEWAYS)
+
+
+def send_to(gwid, frame):
+    writer = GATEWAYS.get(gwid)
+    if writer is None:
+        return False
+    writer.enqueue(frame)
+    return True
+
+
+def downlink_stats():
+    return {gwid: writer.stats() for gwid, writer in list(GATEWAYS.items())}
@@ -0,0 +1,130 @@
+"""
+Bulk MI frame encoder.
+
+FrameEncoder writes whole frames, ``<header><len><payload>[crc]``, into one
+preallocated bytearray with ``struct.pack_into``: the 17-byte mesh header
+with Message.HEADER, and every sample of a DataIndication with a single
+struct built (and cached) for that sample count. A batch of frames for many
+MACs comes back as one ready-to-send stream, so encoding a cycle of the
+emulator or a burst of downlink messages costs one buffer copy rather than
+a bytearray, a Message and a handful of ``struct.pack`` results per frame.
+"""
+
+import struct
+from DAQ.commands.protocol import Message, DataIndication
+from DAQ.commands.samples import STATUS, SAMPLE_LEN, FIELDS, sample_values, samples_struct
+from DAQ.gateway.framing import MI_HEADER, MI_PREFIX_LEN, CRC_LEN, frame_crc
+from DAQ.util.macs import MACS
+
+#: <cmd_len:1> <cmd:1> in front of a command body
+CMD_PREFIX = struct.Struct(">BB")
+CMD_DATA_INDICATION = int(DataIndication.CMD, 16)
+MAX_PAYLOAD_LEN = 255
+#: the most samples one DataIndication frame can carry (without/with CRC)
+MAX_SAMPLES = (MAX_PAYLOAD_LEN - Message.HEADER_LEN - CMD_PREFIX.size - STATUS.size) // SAMPLE_LEN
+MAX_SAMPLES_CRC = (MAX_PAYLOAD_LEN - CRC_LEN - Message.HEADER_LEN - CMD_PREFIX.size - STATUS.size) // SAMPLE_LEN
+
+
+class FrameEncoder:
+    """
+    Encode mesh frames into one reusable buffer.
+
+    ``add_*`` appends a frame; ``getvalue()`` returns the frames added since
+    the last ``reset()`` as one bytes stream. ``encode_data()`` does all three
+    for a batch of MACs.
+    """
+
+    def __init__(self, with_crc=False, header=MI_HEADER, capacity=64 * 1024):
+        self.with_crc = with_crc
+        self.header = header
+        self.buffer = bytearray(capacity)
+        self.size = 0
+
+    def reset(self):
+        self.size = 0
+
+    def getvalue(self):
+        with memoryview(self.buffer) as view:
+            return bytes(view[:self.size])
+
+    def _reserve(self, nbytes):
+        if self.size + nbytes > len(self.buffer):
+            self.buffer.extend(bytes(max(len(self.buffer), nbytes)))
+
+    def _open_frame(self, payload_len, header):
+        """Write the frame prefix; returns the offset of the payload."""
+        if self.with_crc:
+            payload_len += CRC_LEN
+        if payload_len > MAX_PAYLOAD_LEN:
+            raise ValueError(f"Frame payload too large: {payload_len} bytes")
+        self._reserve(MI_PREFIX_LEN + payload_len)
+        start = self.size
+        self.buffer[start:start + 2] = header or self.header
+        self.buffer[start + 2] = payload_len
+        return start + MI_PREFIX_LEN
+
+    def _close_frame(self, offset):
+        """Append the CRC when enabled and advance past the frame ending at ``offset``."""
+        if self.with_crc:
+            with memoryview(self.buffer) as view:
+                crc = frame_crc(view[self.size + 2:self.size + 3], view[self.size + MI_PREFIX_LEN:offset])
+            self.buffer[offset] = crc & 0xFF
+            self.buffer[offset + 1] = crc >> 8
+            offset += CRC_LEN
+        self.size = offset
+
+    def _pack_header(self, offset, addr, request_id=0, source_hopcount=0, source_queue_length=0,
+                     hopcount=0, queue_length=0, dtype=Message.TYPE_PLM, ctrl=0, partnum=1, numparts=1):
+        Message.HEADER.pack_into(self.buffer, offset, ctrl, addr, request_id, source_hopcount,
+                                 source_queue_length, hopcount, queue_length, dtype,
+                                 ((partnum - 1) << 4) | (numparts - 1))
+        return offset + Message.HEADER_LEN
+
+    def add_data_indication(self, macaddr, samples, op_stat=0, reg_stat=0, **header):
+        """
+        Append one DataIndication frame for ``macaddr`` (a MAC slot or any
+        textual form) carrying ``samples``,
+        ``(timestamp, Vi, Vo, Ii, Io, Pi, Po)`` tuples in engineering units.
+        ``header`` takes the Message header fields (request_id, dtype, ...).
+        """
+        values = sample_values(samples)
+        count = len(values) // len(FIELDS)
+        body_len = STATUS.size + count * SAMPLE_LEN
+
+        offset = self._open_frame(Message.HEADER_LEN + CMD_PREFIX.size + body_len, None)
+        wire = MACS.wire[macaddr] if isinstance(macaddr, int) else MACS.to_wire(macaddr)
+        offset = self._pack_header(offset, wire, **header)
+        CMD_PREFIX.pack_into(self.buffer, offset, 1 + body_len, CMD_DATA_INDICATION)
+        offset += CMD_PREFIX.size
+        STATUS.pack_into(self.buffer, offset, op_stat, reg_stat)
+        offset += STATUS.size
+        samples_struct(count).pack_into(self.buffer, offset, *values)
+        self._close_frame(offset + count * SAMPLE_LEN)
+
+    def add_message(self, message, header=None):
+        """Append any Message; its commands are serialised with their own decompile()."""
+        body = b"".join(cmd.decompile() for cmd in message.commands)
+        offset = self._open_frame(Message.HEADER_LEN + len(body), header)
+        offset = self._pack_header(offset, message.wire, message.request_id,
+                                   message.source_hopcount, message.source_queue_length,
+                                   message.hopcount, message.queue_length,
+                                   (message._reserved << 4) | message.dtype, int(message.mesh_ctrl),
+                                   message.partnum, message.numparts)
+        self.buffer[offset:offset + len(body)] = body
+        self._close_frame(offset + len(body))
+
+    def encode_data(self, readings, op_stat=0, reg_stat=0, **header):
+        """
+        One MI stream holding a DataIndication frame per ``(macaddr, samples)``
+        in ``readings``; ``op_stat``, ``reg_stat`` and ``header`` apply to every frame.
+        """
+        self.reset()
+        for macaddr, samples in readings:
+            self.add_data_indication(macaddr, samples, op_stat, reg_stat, **header)
+        return self.getvalue()
+
+    def encode_message(self, message, header=None):
+        """A single framed Message."""
+        self.reset()
+        self.add_message(message, header)
+        return self.getvalue()
@@ -0,0 +1,236 @@
+"""
+asyncio.BufferedProtocol implementation of the MI gateway framing.
+
+Frames on the wire are ``b"MI" <len:1> <payload:len>``. The transport reads
+straight into a preallocated bytearray; every complete frame in the buffer is
+extracted in one pass over a memoryview, so a burst of frames costs a single
+copy per read rather than three ``readexactly`` calls per frame, and the
+frames of one read reach recv_queue together as a single list.
+
+Selected with ``gateway.server_mode: buffered`` (the default ``stream`` keeps
+the StreamReader handler in ``DAQ.gateway.server``).
+
+Noisy links: when the bytes at the read position are not ``b"MI"`` the
+decoder jumps to the next header with ``bytearray.find`` instead of stepping
+through the stream, and frames whose length cannot hold a Message header are
+rejected and rescanned. With ``gateway.frame_crc`` enabled the last two
+payload bytes carry a CRC-16/MODBUS (little-endian) over the length byte and
+the rest of the payload; frames that fail the check are rejected. Per-link
+counters live in ``LINK_STATS`` (see ``link_quality()``).
+
+Retransmitted frames are dropped before decoding (see DAQ.gateway.dedupe).
+"""
+
+import asyncio
+from DAQ.util.logger import make_logger
+from DAQ.util.utctime import utcepochnow
+from DAQ.lib.crc import crc16
+from DAQ.commands.protocol import Message
+from DAQ.gateway.ingest import IngestEnvelope, IngestQueue
+from DAQ.gateway.dedupe import DEDUPE
+
+logger = make_logger("gateway")
+
+MI_HEADER = b"MI"
+MI_PREFIX_LEN = 3  # b"MI" + length byte
+MAX_FRAME_LEN = MI_PREFIX_LEN + 255
+CRC_LEN = 2
+MIN_PAYLOAD_LEN = sum(Message.LEN_ORDER)
+
+_M = MI_HEADER[0]
+_I = MI_HEADER[1]
+
+
+class LinkStats:
+    __slots__ = ("frames", "bytes_received", "bytes_skipped", "frames_rejected", "crc_errors", "resyncs",
+                 "duplicates")
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes_received = 0
+        self.bytes_skipped = 0
+        self.frames_rejected = 0
+        self.crc_errors = 0
+        self.resyncs = 0
+        self.duplicates = 0
+
+    def merge(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+#: live connections, keyed by peer "host:port"
+LINK_STATS = {}
+#: counters folded in from connections that have closed
+_retired = LinkStats()
+
+
+def register_link(peername):
+    stats = LinkStats()
+    LINK_STATS[f"{peername[0]}:{peername[1]}"] = stats
+    return stats
+
+
+def retire_link(peername):
+    stats = LINK_STATS.pop(f"{peername[0]}:{peername[1]}", None)
+    if stats is not None:
+        _retired.merge(stats)
+
+
+def link_quality():
+    """Per-link counters plus a running total that includes closed links."""
+    total = LinkStats()
+    total.merge(_retired)
+    links = {}
+    for peer, stats in list(LINK_STATS.items()):
+        total.merge(stats)
+        links[peer] = stats.as_dict()
+    return {"links": links, "total": total.as_dict()}
+
+
+def frame_crc(length_byte, payload):
+    """CRC over the length byte and the payload (without its trailing CRC)."""
+    return crc16(payload, crc16(length_byte))
+
+
+def crc_ok(length_byte, payload):
+    return len(payload) >= CRC_LEN \
+        and frame_crc(length_byte, payload[:-CRC_LEN]) == (payload[-CRC_LEN] | payload[-1] << 8)
+
+
+def mi_frame(payload, with_crc=False, header=MI_HEADER):
+    """Wrap a Message payload as ``<header><len><payload>[crc]`` (``MI`` by default)."""
+    if with_crc:
+        length_byte = bytes([len(payload) + CRC_LEN])
+        crc = frame_crc(length_byte, payload)
+        return header + length_byte + payload + bytes([crc & 0xFF, crc >> 8])
+    return header + bytes([len(payload)]) + payload
+
+
+class MIFrameProtocol(asyncio.BufferedProtocol):
+    def __init__(self, recv_queue: IngestQueue, gwid=None, buffer_size=65536, check_crc=False):
+        self.recv_queue = recv_queue
+        self.gwid = gwid
+        self.check_crc = check_crc
+        self.transport = None
+        self.peername = None
+        self.stats = LinkStats()
+
+        self.buffer = bytearray(max(buffer_size, MAX_FRAME_LEN))
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first unconsumed byte
+        self.end = 0    # one past the last received byte
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peername = transport.get_extra_info("peername")
+        self.stats = register_link(self.peername)
+        if self.gwid is None:
+            self.gwid = f"{self.peername[0]}:{self.peername[1]}"
+        self.recv_queue.register(transport)
+        logger.info(f"[TCP] Connection from {self.peername[0]}:{self.peername[1]}")
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            logger.warning(f"[TCP] Connection lost: {self.peername} ({exc})")
+        else:
+            logger.info(f"[TCP] Disconnected: {self.peername[0]}:{self.peername[1]}")
+        retire_link(self.peername)
+        self.recv_queue.unregister(self.transport)
+        self.transport = None
+
+    def get_buffer(self, sizehint):
+        if len(self.buffer) - self.end < MAX_FRAME_LEN:
+            self._compact()
+        return self.view[self.end:]
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+        self.stats.bytes_received += nbytes
+        timestamp = utcepochnow()
+        batch = []
+
+        for length, raw in self.extract_frames():
+            if DEDUPE is not None and DEDUPE.seen(raw):
+                self.stats.duplicates += 1
+                continue
+            try:
+                batch.append(IngestEnvelope.decode(self.gwid, Message.MESH_INDICATION, length, raw, timestamp))
+            except Exception:
+                self.stats.frames_rejected += 1
+                logger.exception("[TCP] Failed to parse message")
+
+        if batch:
+            self.recv_queue.offer(batch)
+
+    def eof_received(self):
+        return False
+
+    def extract_frames(self):
+        """
+        Walk the buffer once and return ``(length, payload)`` for every
+        complete frame. Payloads are memoryview slices of a single snapshot
+        of the consumed region, so they stay valid after the receive buffer
+        is reused.
+        """
+        buf, pos, end = self.buffer, self.start, self.end
+        stats = self.stats
+        check_crc = self.check_crc
+        min_len = MIN_PAYLOAD_LEN + CRC_LEN if check_crc else MIN_PAYLOAD_LEN
+        spans = []
+
+        while end - pos >= MI_PREFIX_LEN:
+            if buf[pos] != _M or buf[pos + 1] != _I:
+                nxt = buf.find(MI_HEADER, pos + 1, end)
+                if nxt < 0:
+                    # keep a trailing "M": it may be the first half of a header
+                    nxt = end - 1 if buf[end - 1] == _M else end
+                stats.resyncs += 1
+                stats.bytes_skipped += nxt - pos
+                pos = nxt
+                continue
+
+            length = buf[pos + 2]
+            if length < min_len:
+                stats.frames_rejected += 1
+                stats.bytes_skipped += 1
+                pos += 1
+                continue
+
+            if end - pos - MI_PREFIX_LEN < length:
+                break
+
+            frame_end = pos + MI_PREFIX_LEN + length
+            if check_crc:
+                expected = buf[frame_end - 2] | buf[frame_end - 1] << 8
+                if crc16(self.view[pos + 3:frame_end - CRC_LEN], crc16(self.view[pos + 2:pos + 3])) != expected:
+                    stats.crc_errors += 1
+                    stats.frames_rejected += 1
+                    stats.bytes_skipped += 1
+                    pos += 1
+                    continue
+                length -= CRC_LEN
+
+            spans.append((pos + MI_PREFIX_LEN, length))
+            stats.frames += 1
+            pos = frame_end
+
+        frames = []
+        if spans:
+            base = self.start
+            snapshot = memoryview(bytes(self.view[base:pos]))
+            frames = [(length, snapshot[offset - base:offset - base + length]) for offset, length in spans]
+
+        self.start = pos
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        return frames
+
+    def _compact(self):
+        pending = self.end - self.start
+        self.buffer[:pending] = self.buffer[self.start:self.end]
+        self.start, self.end = 0, pending
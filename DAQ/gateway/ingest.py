@@ -0,0 +1,389 @@
+"""
+Ingest envelopes passed from the gateway server to DAQProcess, and the
+bounded queue that carries them.
+
+A frame is decoded once, where it is read off the wire, and the decoded
+Message travels with its envelope through recv_queue so the dispatch path
+never has to parse the same bytes again. Only the header is decoded at the
+gateway; the commands are parsed when DAQProcess first reads them, so frames
+that are dropped, routed or counted on the way never have their payload
+walked.
+
+IngestQueue bounds recv_queue (``daq.backpressure_qsize``) and applies one
+of the ``daq.backpressure_policy`` policies when it is full. The bound counts
+queued items, and an item is a batch of frames: one read's worth in buffered
+mode, one FrameBatcher batch (at most ``gateway.batch_max`` frames) in stream
+mode, one acceptor batch in acceptor mode. At most about
+``backpressure_qsize * gateway.batch_max`` frames are held.
+
+  pause        pause_reading() on every registered gateway transport (both
+               server modes and the acceptor pipes register theirs) until
+               the queue drains to half; StreamReader producers also block
+               in put() when a batch fills up
+  drop_oldest  discard the oldest queued item
+  drop_newest  discard the newest low-priority item (the incoming one unless
+               it is a priority frame and a low-priority item is queued)
+  spill        append to a local disk spool, refilled in order as it drains
+
+Gateway connections hand frames over in lists (one per read, or per
+``gateway.batch_latency`` window via FrameBatcher) and DAQProcess drains
+whatever is available with get_batch(), so the event loop wakes once per
+batch rather than once per frame.
+"""
+
+import asyncio
+import os
+import struct
+import tempfile
+from DAQ.commands.protocol import Message
+from DAQ.lib.encoding import encode_obj, decode_obj
+from DAQ.util.logger import make_logger
+
+logger = make_logger("IngestQueue")
+
+
+class IngestEnvelope:
+    __slots__ = ("gwid", "msg_type", "length", "raw", "received_on", "message")
+
+    def __init__(self, gwid: str, msg_type: str, length: int, raw: bytes,
+                 received_on: float, message: Message = None):
+        self.gwid = gwid
+        self.msg_type = msg_type
+        self.length = length
+        self.raw = raw
+        self.received_on = received_on
+        self.message = message
+
+    @classmethod
+    def decode(cls, gwid, msg_type, length, raw, received_on):
+        """Decode a raw frame's header into an envelope. Raises if the header is unusable."""
+        message = Message.from_raw(msg_type, length, raw, received_on, lazy=True)
+        return cls(gwid, msg_type, length, raw, received_on, message)
+
+    @classmethod
+    def from_tuple(cls, payload):
+        """Decode a legacy ``(gwid, msg_type, length, raw, received_on)`` tuple."""
+        return cls.decode(*payload)
+
+    def __reduce__(self):
+        return (IngestEnvelope, (self.gwid, self.msg_type, self.length, bytes(self.raw),
+                                 self.received_on, self.message))
+
+    def to_tuple(self):
+        return (self.gwid, self.msg_type, self.length, bytes(self.raw), self.received_on)
+
+    @property
+    def commands(self):
+        return self.message.commands if self.message is not None else []
+
+    @property
+    def priority(self):
+        return self.message is not None and self.message.mesh_ctrl.prior
+
+    def __repr__(self):
+        return f"<IngestEnvelope {self.gwid} {self.msg_type}:{self.length} {self.message!r}>"
+
+
+def priority_of(item):
+    if isinstance(item, list):
+        return any(priority_of(i) for i in item)
+    return bool(getattr(item, "priority", False))
+
+
+def _spool_record(item):
+    if isinstance(item, IngestEnvelope):
+        return ("envelope", item.to_tuple())
+    if isinstance(item, list):
+        return ("batch", [_spool_record(i) for i in item])
+    return ("item", item)
+
+
+def _spool_restore(record):
+    kind, data = record
+    if kind == "envelope":
+        return IngestEnvelope.from_tuple(data)
+    if kind == "batch":
+        return [_spool_restore(r) for r in data]
+    return data
+
+
+class DiskSpool:
+    """
+    Append-only FIFO of pickled records in a local file. The file is
+    truncated whenever the reader catches up with the writer.
+    """
+    _LEN = struct.Struct(">I")
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.count = 0
+        self._fh = None
+        self._read_pos = 0
+        self._write_pos = 0
+
+    def __len__(self):
+        return self.count
+
+    def _open(self):
+        if self._fh is None:
+            self._fh = open(self.path, "w+b")
+        return self._fh
+
+    def push(self, item):
+        record = encode_obj(_spool_record(item))
+
+        if self._write_pos + self._LEN.size + len(record) > self.max_bytes:
+            return False
+
+        fh = self._open()
+        fh.seek(self._write_pos)
+        fh.write(self._LEN.pack(len(record)))
+        fh.write(record)
+        self._write_pos = fh.tell()
+        self.count += 1
+        return True
+
+    def pop(self):
+        fh = self._open()
+        fh.flush()
+        fh.seek(self._read_pos)
+        size, = self._LEN.unpack(fh.read(self._LEN.size))
+        record = decode_obj(fh.read(size))
+        self._read_pos = fh.tell()
+        self.count -= 1
+
+        if self.count == 0:
+            fh.truncate(0)
+            self._read_pos = self._write_pos = 0
+
+        return _spool_restore(record)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class IngestQueue(asyncio.Queue):
+    PAUSE = "pause"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    SPILL = "spill"
+    POLICIES = (PAUSE, DROP_OLDEST, DROP_NEWEST, SPILL)
+
+    def __init__(self, maxsize=0, policy=PAUSE, spill_path=None, spill_max_bytes=256 * 1024 * 1024):
+        # the bound is enforced here rather than by asyncio.Queue so that
+        # protocol callbacks can always offer() without blocking; items are
+        # dropped and refilled behind its back, so join()/task_done() are
+        # not meaningful on an IngestQueue
+        super().__init__()
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+
+        self.limit = maxsize
+        self.low_water = maxsize // 2
+        self.policy = policy
+        self.transports = set()
+        self.paused = False
+        self._space = asyncio.Event()
+        self._space.set()
+
+        self.spool = None
+        if policy == self.SPILL:
+            if spill_path is None:
+                spill_path = os.path.join(tempfile.gettempdir(), f"meshserver-ingest-{os.getpid()}.spool")
+            self.spool = DiskSpool(spill_path, spill_max_bytes)
+
+        self.counters = dict(accepted=0, paused=0, resumed=0, blocked=0,
+                             dropped_oldest=0, dropped_newest=0, evicted=0,
+                             spilled=0, unspilled=0, spill_dropped=0)
+
+    def at_limit(self):
+        return 0 < self.limit <= self.qsize()
+
+    def stats(self):
+        stats = dict(self.counters, policy=self.policy, qsize=self.qsize(), limit=self.limit)
+        if self.spool is not None:
+            stats["spooled"] = len(self.spool)
+        return stats
+
+    # -- producers -------------------------------------------------------
+
+    def register(self, transport):
+        self.transports.add(transport)
+        if self.paused:
+            transport.pause_reading()
+
+    def unregister(self, transport):
+        self.transports.discard(transport)
+
+    def offer(self, item):
+        """Non-blocking put that applies the backpressure policy. Returns False if the item was dropped."""
+        policy = self.policy
+
+        if policy == self.SPILL and (len(self.spool) or self.at_limit()):
+            # once spilling, everything goes through the spool to keep order
+            if self.spool.push(item):
+                self.counters["spilled"] += 1
+                return True
+            self.counters["spill_dropped"] += 1
+            return False
+
+        if self.at_limit():
+            if policy == self.PAUSE:
+                self._pause()
+            elif policy == self.DROP_OLDEST:
+                self._queue.popleft()
+                self.counters["dropped_oldest"] += 1
+            elif policy == self.DROP_NEWEST:
+                if not self._evict_newest_low_priority(item):
+                    self.counters["dropped_newest"] += 1
+                    return False
+
+        self.put_nowait(item)
+        self.counters["accepted"] += 1
+        if policy == self.PAUSE and self.at_limit():
+            self._pause()
+        return True
+
+    async def put(self, item):
+        if self.policy == self.PAUSE:
+            while self.at_limit():
+                self.counters["blocked"] += 1
+                self._space.clear()
+                await self._space.wait()
+        self.offer(item)
+
+    def _evict_newest_low_priority(self, item):
+        if not priority_of(item):
+            return False
+        queue = self._queue
+        for i in range(len(queue) - 1, -1, -1):
+            if not priority_of(queue[i]):
+                del queue[i]
+                self.counters["evicted"] += 1
+                return True
+        return False
+
+    def _pause(self):
+        if not self.paused:
+            self.paused = True
+            self.counters["paused"] += 1
+            logger.warning(f"[INGEST] Queue full ({self.qsize()}/{self.limit}); pausing {len(self.transports)} gateway transport(s)")
+            for transport in list(self.transports):
+                transport.pause_reading()
+
+    def _resume(self):
+        self.paused = False
+        self.counters["resumed"] += 1
+        logger.info(f"[INGEST] Queue drained to {self.qsize()}; resuming gateway transports")
+        for transport in list(self.transports):
+            if not transport.is_closing():
+                transport.resume_reading()
+
+    # -- consumer --------------------------------------------------------
+
+    def _get(self):
+        item = self._queue.popleft()
+
+        if self.spool is not None and len(self.spool) and self.qsize() <= self.low_water:
+            while len(self.spool) and not self.at_limit():
+                self._queue.append(self.spool.pop())
+                self.counters["unspilled"] += 1
+
+        if self.qsize() <= self.low_water:
+            if self.paused:
+                self._resume()
+            self._space.set()
+
+        return item
+
+    async def get_batch(self, max_items=1024, latency=0.0):
+        """
+        Wait for at least one item, then drain everything available up to
+        ``max_items`` frames, waiting at most ``latency`` seconds for more.
+        Batches queued by the gateway are flattened into the result; one
+        that would overshoot ``max_items`` is split and its remainder goes
+        back to the head of the queue.
+        """
+        batch = []
+        self._extend(batch, await self.get(), max_items)
+
+        if len(batch) < max_items and latency > 0:
+            deadline = asyncio.get_running_loop().time() + latency
+        else:
+            deadline = None
+
+        while len(batch) < max_items:
+            if not self.empty():
+                self._extend(batch, self.get_nowait(), max_items)
+                continue
+            if deadline is None:
+                break
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                self._extend(batch, await asyncio.wait_for(self.get(), remaining), max_items)
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    def _extend(self, batch, item, max_items):
+        if not isinstance(item, list):
+            batch.append(item)
+            return
+        room = max_items - len(batch)
+        if len(item) > room:
+            self._queue.appendleft(item[room:])
+            item = item[:room]
+        batch.extend(item)
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+
+
+class FrameBatcher:
+    """
+    Collects envelopes from one gateway connection and hands them to the
+    IngestQueue as a list once ``max_size`` frames are pending or
+    ``latency`` seconds after the first one arrived.
+    """
+
+    def __init__(self, queue: IngestQueue, max_size=256, latency=0.005):
+        self.queue = queue
+        self.max_size = max_size
+        self.latency = latency
+        self.batch = []
+        self._timer = None
+
+    def add(self, envelope):
+        """Add a frame; returns True when the batch is full and should be flushed."""
+        self.batch.append(envelope)
+        if len(self.batch) == 1 and self.latency > 0:
+            self._timer = asyncio.get_running_loop().call_later(self.latency, self.flush)
+        return len(self.batch) >= self.max_size or self.latency <= 0
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.batch = self.batch, []
+        return batch
+
+    def flush(self):
+        batch = self._take()
+        if batch:
+            self.queue.offer(batch)
+
+    async def flush_wait(self):
+        batch = self._take()
+        if batch:
+            await self.queue.put(batch)
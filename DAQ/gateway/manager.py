@@ -2,34 +2,52 @@
 Async GatewayManager that launches:
 - Gateway TCP server (emulator input)
 - UDP autodiscovery responder
+- Downlink to the connected gateways (send_all, see DAQ.gateway.downlink)
+- MAC → gateway routing for unicast downlink (send_unicast, see DAQ.gateway.routing)
 
 Integrated with asyncio.Queue and DAQProcess.
 """
 
 import asyncio
 from DAQ.gateway.server import start_gateway_servers
+from DAQ.gateway.framing import link_quality
+from DAQ.gateway.acceptors import AcceptorPool
+from DAQ.gateway import downlink
+from DAQ.gateway.routing import RoutingTable
+from DAQ.gateway.dedupe import dedupe_stats
+from DAQ.commands.protocol import Message
 from DAQ.util.logger import make_logger
 from DAQ.util.config import load_config
+from DAQ.util.timers import TimerWheel
 
 logger = make_logger("GatewayManager")
 cfg = load_config()
 
 class GatewayManager:
-    def __init__(self, host: str, port: int, recv_queue: asyncio.Queue):
+    def __init__(self, host: str, port: int, recv_queue: asyncio.Queue, timers: TimerWheel = None):
         self.host = host
         self.port = port
         self.recv_queue = recv_queue
 
+        # without a shared wheel from the caller the manager drives its own
+        self._own_timers = timers is None
+        self.timers = timers if timers is not None else TimerWheel()
+        self.routes = RoutingTable(self.timers, cfg.get("gateway", {}).get("route_ttl", 900))
+
         self.tcp_server = None
         self.udp_transport = None
 
     async def start(self):
         logger.info("Starting GatewayManager...")
         self.tcp_server, self.udp_transport = await start_gateway_servers(self.recv_queue)
+        if self._own_timers:
+            self.timers.start()
         logger.info("GatewayManager started.")
 
     async def stop(self):
         logger.info("Stopping GatewayManager...")
+        if self._own_timers:
+            self.timers.stop()
 
         if self.tcp_server:
             self.tcp_server.close()
@@ -42,5 +60,60 @@ class GatewayManager:
             self.udp_transport = None
             logger.info("UDP transport closed.")
 
+    def link_stats(self):
+        """Framing counters (frames, bytes skipped, frames rejected, ...) per gateway link."""
+        stats = link_quality()
+        stats["downlink"] = downlink.downlink_stats()
+        stats["routes"] = self.routes.stats()
+        stats["dedupe"] = dedupe_stats()
+        if isinstance(self.tcp_server, AcceptorPool):
+            stats["acceptors"] = self.tcp_server.link_stats()
+            stats["unicast"] = self.tcp_server.unicast_stats()
+        return stats
+
     def send_all(self, message):
-        logger.debug("send_all() called but not implemented in async GatewayManager")
+        """
+        Queue a mesh message on every connected gateway. The frame is encoded
+        once and handed to the per-gateway writers without awaiting; returns
+        the number of gateways (acceptors, in acceptor mode) it was queued on.
+        """
+        return self._flood(downlink.encode_message(Message.MESH_MESSAGE, message), message)
+
+    def send_unicast(self, message):
+        """
+        Queue a unicast mesh message on the gateway its node was last heard
+        through. Falls back to every gateway when no live route is known.
+        Returns the number of gateways (acceptors, in acceptor mode) it was
+        queued on.
+        """
+        frame = downlink.encode_message(Message.MESH_UNICAST, message)
+        route = self.routes.lookup(message.mac)
+
+        if route is not None:
+            if isinstance(self.tcp_server, AcceptorPool):
+                # the core does not know which acceptor holds the gateway;
+                # only the one that does writes the frame, and if none does
+                # the pool floods it and the route is forgotten
+                return self.tcp_server.send_to(route.gwid, frame,
+                                               on_miss=lambda: self.routes.forget(message.mac))
+            if downlink.send_to(route.gwid, frame):
+                return 1
+            self.routes.forget(message.mac)
+
+        logger.debug(f"[DOWNLINK] No route to {message.addr}; sending via all gateways")
+        return self._flood(frame, message)
+
+    def observe(self, envelope):
+        """Record the gateway and hopcount a mesh indication arrived with."""
+        message = envelope.message
+        self.routes.observe(message.mac, envelope.gwid, message.hopcount)
+
+    def _flood(self, frame, message):
+        if isinstance(self.tcp_server, AcceptorPool):
+            count = self.tcp_server.broadcast(frame)
+        else:
+            count = downlink.broadcast(frame)
+
+        if not count:
+            logger.warning(f"[DOWNLINK] No gateway connected; dropped message {message.request_id}")
+        return count
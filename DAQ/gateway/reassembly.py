@@ -0,0 +1,112 @@
+"""
+Reassembly of multi-part mesh messages.
+
+Parts are collected per ``(mac slot, request_id)`` (the wire address stands
+in for the slot when the MAC registry is full) and joined with a single
+copy once every part is present; the first part's header then carries the
+parsed commands of the whole message. A held part keeps a copy of its
+payload, not the slice of the receive buffer it was framed from, so it
+pins only its own bytes.
+
+Memory is bounded two ways: an incomplete set is evicted
+``daq.reassembly_timeout`` seconds after its first part arrived (on the
+shared TimerWheel), and when the payload bytes held across all sets exceed
+``daq.reassembly_max_bytes`` the oldest sets are evicted first. Since parts
+hold their own copies, that count is the memory actually held.
+"""
+
+from collections import OrderedDict
+from DAQ.commands.protocol import Message
+from DAQ.util.logger import make_logger
+from DAQ.util.timers import TimerWheel
+
+logger = make_logger("reassembly")
+
+
+class PartSet:
+    __slots__ = ("numparts", "parts", "nbytes", "timer")
+
+    def __init__(self, numparts):
+        self.numparts = numparts
+        self.parts = {}
+        self.nbytes = 0
+        self.timer = None
+
+
+class Reassembler:
+    def __init__(self, timers: TimerWheel, timeout=30.0, max_bytes=4 * 1024 * 1024):
+        self.timers = timers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.sets = OrderedDict()  # oldest first
+        self.nbytes = 0
+        self.counters = dict(started=0, completed=0, duplicates=0, invalid=0,
+                             evicted_timeout=0, evicted_memory=0, evicted_mismatch=0)
+
+    def __len__(self):
+        return len(self.sets)
+
+    def add(self, message: Message):
+        """
+        Add one part. Returns the reassembled Message when this part
+        completed its set, otherwise None.
+        """
+        if message.partnum > message.numparts:
+            self.counters["invalid"] += 1
+            return None
+
+        key = (message.mac if message.mac >= 0 else message.wire, message.request_id)
+        parts = self.sets.get(key)
+
+        if parts is not None and parts.numparts != message.numparts:
+            self._evict(key, "evicted_mismatch")
+            parts = None
+
+        if parts is None:
+            parts = self.sets[key] = PartSet(message.numparts)
+            parts.timer = self.timers.schedule(self.timeout, self._evict, key, "evicted_timeout")
+            self.counters["started"] += 1
+
+        if message.partnum in parts.parts:
+            self.counters["duplicates"] += 1
+            return None
+
+        # the payload is a view into a per-read snapshot of up to recv_buffer_size
+        # bytes; holding it would pin that whole buffer
+        message.payload, message.raw = bytes(message.payload), b""
+        parts.parts[message.partnum] = message
+        parts.nbytes += len(message.payload)
+        self.nbytes += len(message.payload)
+
+        if len(parts.parts) == parts.numparts:
+            return self._complete(key, parts)
+
+        while self.nbytes > self.max_bytes and self.sets:
+            self._evict(next(iter(self.sets)), "evicted_memory")
+        return None
+
+    def _complete(self, key, parts):
+        self._discard(key)
+        ordered = [parts.parts[n] for n in sorted(parts.parts)]
+
+        message = ordered[0]
+        message.partnum = message.numparts = 1
+        message.parse_payload(b"".join(part.payload for part in ordered))
+        self.counters["completed"] += 1
+        return message
+
+    def _discard(self, key):
+        parts = self.sets.pop(key)
+        parts.timer.cancel()
+        self.nbytes -= parts.nbytes
+        return parts
+
+    def _evict(self, key, reason):
+        if key not in self.sets:
+            return
+        parts = self._discard(key)
+        self.counters[reason] += 1
+        logger.debug(f"[REASSEMBLY] Dropped {len(parts.parts)}/{parts.numparts} parts of {key} ({reason})")
+
+    def stats(self):
+        return dict(self.counters, pending=len(self.sets), bytes_held=self.nbytes)
@@ -0,0 +1,81 @@
+"""
+MAC → gateway routing table for unicast downlink.
+
+Every mesh indication records the gateway connection its node was last heard
+through, with the hopcount it arrived at, keyed by the node's MAC registry
+slot. Lookups and updates are a single dict access. Entries expire
+``gateway.route_ttl`` seconds after the node was last heard: each route
+holds one timer on the shared TimerWheel, which re-arms itself for the
+remaining time when the node has been heard again since, so refreshing a
+route never touches the wheel.
+"""
+
+from DAQ.util.timers import TimerWheel
+from DAQ.util.macs import MACS
+
+
+def mac_key(mac):
+    """The routing key for a MAC: its registry slot (given as is, or looked up from any textual form)."""
+    return MACS.slot(mac)
+
+
+class Route:
+    __slots__ = ("gwid", "hopcount", "last_seen", "timer")
+
+    def __init__(self, gwid, hopcount, last_seen):
+        self.gwid = gwid
+        self.hopcount = hopcount
+        self.last_seen = last_seen
+        self.timer = None
+
+    def __repr__(self):
+        return f"<Route via {self.gwid} hops={self.hopcount}>"
+
+
+class RoutingTable:
+    def __init__(self, timers: TimerWheel, ttl=900):
+        self.timers = timers
+        self.ttl = ttl
+        self.routes = {}
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.routes)
+
+    def observe(self, mac, gwid, hopcount):
+        key = mac_key(mac)
+        if key < 0:
+            return  # not in the MAC registry (full): nothing to key the route by
+        now = self.timers.clock()
+        route = self.routes.get(key)
+
+        if route is None:
+            route = self.routes[key] = Route(gwid, hopcount, now)
+            route.timer = self.timers.schedule(self.ttl, self._expire, key)
+        else:
+            route.gwid = gwid
+            route.hopcount = hopcount
+            route.last_seen = now
+
+    def lookup(self, mac):
+        return self.routes.get(mac_key(mac))
+
+    def forget(self, mac):
+        route = self.routes.pop(mac_key(mac), None)
+        if route is not None:
+            route.timer.cancel()
+
+    def _expire(self, key):
+        route = self.routes.get(key)
+        if route is None:
+            return
+
+        remaining = route.last_seen + self.ttl - self.timers.clock()
+        if remaining > 0:
+            route.timer = self.timers.schedule(remaining, self._expire, key)
+        else:
+            del self.routes[key]
+            self.expired += 1
+
+    def stats(self):
+        return dict(routes=len(self.routes), expired=self.expired)
@@ -10,6 +10,24 @@ Config-driven from config.yaml:
     ad_host: "0.0.0.0"
     ad_listen_port: 59991
     ad_respond_port: 59992
+    server_mode: "stream"        # "stream" (StreamReader) or "buffered" (MIFrameProtocol)
+    recv_buffer_size: 65536      # receive buffer for the buffered framing
+    frame_crc: false             # frames carry a trailing CRC-16 (see DAQ.gateway.framing)
+    batch_max: 256               # frames per recv_queue batch (stream mode)
+    batch_latency: 0.005         # max seconds a frame waits for its batch (stream mode)
+    acceptors: 0                 # >1: accept/parse in N SO_REUSEPORT processes (DAQ.gateway.acceptors)
+    acceptor_qsize: 64           # per-acceptor queue of batches awaiting the pipe to the core
+    packet_delay: 0.2            # downlink pacing: 1 / packet_delay frames per second per gateway
+    packet_batch: 10             # downlink token bucket burst (frames per coalesced write)
+    downlink_max_pending: 1024   # per-gateway outbound queue; the oldest frame is dropped when full
+    downlink_max_buffer: 65536   # hold writes while the transport buffers more than this
+    route_ttl: 900               # seconds a MAC → gateway route lives after the node was last heard
+    dedupe_window: 30.0          # seconds a frame fingerprint is remembered (0 disables, see DAQ.gateway.dedupe)
+    dedupe_capacity: 65536       # fingerprints per generation (memory bound of the filter)
+
+Each gateway connection is identified by its peer "host:port": that is the
+gwid carried by its envelopes (and so by the routing table) and the key it
+is registered under with DAQ.gateway.downlink.
 """
 
 import asyncio
@@ -18,6 +36,12 @@ from DAQ.util.config import load_config
 from DAQ.util.utctime import utcepochnow
 from DAQ.util.hex import _h
 from DAQ.commands.protocol import Message
+from DAQ.gateway.ingest import IngestEnvelope, FrameBatcher
+from DAQ.gateway.acceptors import AcceptorPool
+from DAQ.gateway import downlink
+from DAQ.gateway.dedupe import DEDUPE
+from DAQ.gateway.framing import (MIFrameProtocol, MI_HEADER, CRC_LEN, MIN_PAYLOAD_LEN,
+                                 crc_ok, register_link, retire_link)
 
 logger = make_logger("gateway")
 cfg = load_config()
@@ -26,46 +50,125 @@ comm_host = cfg["gateway"]["comm_host"]
 comm_port = cfg["gateway"]["comm_port"]
 ad_listen_port = cfg["gateway"]["ad_listen_port"]
 ad_respond_port = cfg["gateway"]["ad_respond_port"]
+server_mode = cfg["gateway"].get("server_mode", "stream")
+recv_buffer_size = cfg["gateway"].get("recv_buffer_size", 65536)
+frame_crc = cfg["gateway"].get("frame_crc", False)
+batch_max = cfg["gateway"].get("batch_max", 256)
+batch_latency = cfg["gateway"].get("batch_latency", 0.005)
+acceptors = cfg["gateway"].get("acceptors", 0)
+acceptor_qsize = cfg["gateway"].get("acceptor_qsize", 64)
+
+
+async def resync_stream(reader: asyncio.StreamReader, header: bytes):
+    """
+    Consume bytes up to and including the next ``b"MI"`` after an invalid
+    header. Returns the number of bytes skipped.
+    """
+    skipped = 1
+    last = header[1:]
+    while last == MI_HEADER[:1]:
+        nxt = await reader.readexactly(1)
+        if nxt == MI_HEADER[1:]:
+            return skipped
+        skipped += 1
+        last = nxt
+    skipped += 1
+
+    while True:
+        try:
+            return skipped + len(await reader.readuntil(MI_HEADER)) - len(MI_HEADER)
+        except asyncio.LimitOverrunError as e:
+            # no header within the stream limit; drop what was scanned, keep a possible "M"
+            consumed = max(e.consumed - 1, 1)
+            await reader.readexactly(consumed)
+            skipped += consumed
 
 # TCP Handler (MI protocol)
 async def handle_tcp_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, recv_queue: asyncio.Queue):
     addr = writer.get_extra_info("peername")
     logger.info(f"[TCP] Connection from {addr[0]}:{addr[1]}")
+    stats = register_link(addr)
+    gwid = f"{addr[0]}:{addr[1]}"
+    downlink.attach(gwid, writer.transport)
+    # under the pause policy the latency flush offer()s without blocking;
+    # a registered transport is what gets paused when that fills the queue
+    recv_queue.register(writer.transport)
+    batcher = FrameBatcher(recv_queue, batch_max, batch_latency)
+    min_length = MIN_PAYLOAD_LEN + CRC_LEN if frame_crc else MIN_PAYLOAD_LEN
 
     try:
         while True:
             header = await reader.readexactly(2)
-            if header != b"MI":
+            if header != MI_HEADER:
                 logger.warning(f"[TCP] Invalid header from {addr}: {header}")
-                continue
+                stats.resyncs += 1
+                skipped = await resync_stream(reader, header)
+                # skipped covers the bad header too; the "MI" found is counted below
+                stats.bytes_skipped += skipped
+                stats.bytes_received += skipped
 
             length_byte = await reader.readexactly(1)
             length = length_byte[0]
+            stats.bytes_received += 3
+            if length < min_length:
+                stats.frames_rejected += 1
+                continue
 
             raw_payload = await reader.readexactly(length)
+            stats.bytes_received += length
             timestamp = utcepochnow()
 
             logger.debug(f"[TCP] MI:{length}:{_h(raw_payload)}")
 
+            if frame_crc:
+                if not crc_ok(length_byte, raw_payload):
+                    stats.crc_errors += 1
+                    stats.frames_rejected += 1
+                    continue
+                raw_payload = raw_payload[:-CRC_LEN]
+                length -= CRC_LEN
+
+            if DEDUPE is not None and DEDUPE.seen(raw_payload):
+                stats.duplicates += 1
+                continue
+
             try:
-                msg = Message.from_raw(Message.MESH_INDICATION, length, raw_payload, timestamp)
-                logger.debug(f"[TCP] Parsed message with {len(msg.commands)} command(s)")
+                envelope = IngestEnvelope.decode(gwid, Message.MESH_INDICATION, length, raw_payload, timestamp)
+                logger.debug(f"[TCP] Decoded header from {envelope.message.addr}")
             except Exception:
+                stats.frames_rejected += 1
                 logger.exception("[TCP] Failed to parse message")
                 continue
 
-            payload = ("emulator", Message.MESH_INDICATION, length, raw_payload, timestamp)
-            await recv_queue.put(payload)
+            stats.frames += 1
+            if batcher.add(envelope):
+                await batcher.flush_wait()
 
     except asyncio.IncompleteReadError:
         logger.info(f"[TCP] Disconnected: {addr[0]}:{addr[1]}")
     except Exception:
         logger.exception("[TCP] Exception in handler")
     finally:
+        batcher.flush()
+        recv_queue.unregister(writer.transport)
+        retire_link(addr)
+        downlink.detach(gwid)
         writer.close()
         await writer.wait_closed()
 
 
+class GatewayFrameProtocol(MIFrameProtocol):
+    """MIFrameProtocol whose connections are reachable from the downlink."""
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        downlink.attach(self.gwid, transport)
+
+    def connection_lost(self, exc):
+        downlink.detach(self.gwid)
+        super().connection_lost(exc)
+
+
 # UDP Autodiscovery Handler (MARCO → POLO)
 class AutodiscoveryProtocol(asyncio.DatagramProtocol):
     def __init__(self):
@@ -85,17 +188,38 @@ class AutodiscoveryProtocol(asyncio.DatagramProtocol):
 
 
 # Server launcher
-async def start_gateway_servers(recv_queue: asyncio.Queue):
-    # Start TCP server
-    tcp_server = await asyncio.start_server(
+async def start_tcp_server(recv_queue: asyncio.Queue, reuse_port=False):
+    loop = asyncio.get_running_loop()
+
+    if server_mode == "buffered":
+        return await loop.create_server(
+            lambda: GatewayFrameProtocol(recv_queue, buffer_size=recv_buffer_size, check_crc=frame_crc),
+            host=comm_host,
+            port=comm_port,
+            reuse_port=reuse_port
+        )
+
+    return await asyncio.start_server(
         lambda r, w: handle_tcp_connection(r, w, recv_queue),
         host=comm_host,
-        port=comm_port
+        port=comm_port,
+        reuse_port=reuse_port
     )
-    logger.info(f"[TCP] Gateway TCP server listening on {comm_host}:{comm_port}")
 
-    # Start UDP autodiscovery
+
+async def start_gateway_servers(recv_queue: asyncio.Queue):
     loop = asyncio.get_running_loop()
+
+    # Start TCP server
+    if acceptors > 1:
+        tcp_server = AcceptorPool(recv_queue, acceptors)
+        await tcp_server.start()
+        logger.info(f"[TCP] {acceptors} gateway acceptors ({server_mode}) sharing {comm_host}:{comm_port}")
+    else:
+        tcp_server = await start_tcp_server(recv_queue)
+        logger.info(f"[TCP] Gateway TCP server ({server_mode}) listening on {comm_host}:{comm_port}")
+
+    # Start UDP autodiscovery
     transport, _ = await loop.create_datagram_endpoint(
         lambda: AutodiscoveryProtocol(),
         local_addr=(comm_host, ad_listen_port)
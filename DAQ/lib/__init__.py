@@ -1,2 +1,8 @@
-from DAQ.lib.process import DAQProcess
 
+def __getattr__(name):
+    # Resolved lazily so light modules such as DAQ.lib.crc can be imported
+    # from the gateway without pulling in (and cycling through) DAQProcess.
+    if name == "DAQProcess":
+        from DAQ.lib.process import DAQProcess
+        return DAQProcess
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
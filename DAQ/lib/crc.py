@@ -1,10 +1,20 @@
-def crc16(data: bytes):
-    crc = 0xFFFF
-    for b in data:
-        crc ^= b
+def _make_table(poly=0xA001):
+    table = []
+    for byte in range(256):
+        crc = byte
         for _ in range(8):
             if crc & 1:
-                crc = (crc >> 1) ^ 0xA001
+                crc = (crc >> 1) ^ poly
             else:
                 crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+CRC16_TABLE = _make_table()
+
+def crc16(data: bytes, crc=0xFFFF):
+    """CRC-16/MODBUS. Pass a previous result as ``crc`` to continue over more data."""
+    table = CRC16_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
     return crc
@@ -0,0 +1,138 @@
+"""
+Command handler registry and dispatch, shared by DAQProcess and the shard
+workers of DAQ.lib.shards.
+
+Handlers are methods registered with ``@handles(cmd_class)``. A handler
+registered with ``shard=True`` only touches the state of the nodes whose
+commands it is given, so in sharded mode it runs in the worker that owns
+those nodes; every other handler runs in the DAQ core.
+"""
+
+import time
+from DAQ.commands.protocol import DataIndication, COMMAND_TABLE
+from DAQ.commands.samples import decode_data_indications
+from DAQ.util.utctime import SunriseAnchor
+
+CMD_HANDLERS = {}
+#: handlers registered with ``batch=True``; called once with every command of their type in a group
+BATCH_HANDLERS = set()
+#: handlers registered with ``shard=True``; run by the shard workers in sharded mode
+SHARD_HANDLERS = set()
+
+#: which handlers a dispatcher runs: all of them, the core's share or a shard worker's share
+ALL, CORE, SHARD = "all", "core", "shard"
+
+def handles(cmd_class, batch=False, shard=False):
+    def decorator(fn):
+        CMD_HANDLERS.setdefault(fn.__name__, []).append(cmd_class)
+        if batch:
+            BATCH_HANDLERS.add(fn.__name__)
+        if shard:
+            SHARD_HANDLERS.add(fn.__name__)
+        return fn
+    return decorator
+
+def sunrise_anchor(cfg):
+    return SunriseAnchor(str(cfg.get("ephem", {}).get("lat", "0")),
+                         str(cfg.get("ephem", {}).get("lon", "0")),
+                         cfg.get("daq", {}).get("clock_skew", 300.0))
+
+class CommandDispatcher:
+    """
+    Runs the registered handlers for decoded commands. Subclasses set
+    ``logger`` and ``sunrise``, call ``_make_dispatch()`` and implement
+    ``emit()``, which hands a record or batch of records on towards the data
+    handler chain.
+    """
+    role = ALL
+
+    def _make_dispatch(self, role=ALL):
+        self.role = role
+        self.HANDLER_MAP = {}
+        for cmd_class in set(COMMAND_TABLE):
+            self.handlers_for(cmd_class)
+
+    def _runs(self, handler_name):
+        if self.role == ALL:
+            return True
+        return (handler_name in SHARD_HANDLERS) == (self.role == SHARD)
+
+    def handlers_for(self, cmd_class):
+        """
+        ``(per_command, per_batch)`` bound handlers for a command class,
+        resolved against its MRO once and cached.
+        """
+        handlers = self.HANDLER_MAP.get(cmd_class)
+        if handlers is None:
+            per_command, per_batch = [], []
+            for handler_name, cmd_classes in CMD_HANDLERS.items():
+                func = getattr(self, handler_name, None)
+                if func and self._runs(handler_name) and issubclass(cmd_class, tuple(cmd_classes)):
+                    (per_batch if handler_name in BATCH_HANDLERS else per_command).append(func)
+            handlers = self.HANDLER_MAP[cmd_class] = (per_command, per_batch)
+        return handlers
+
+    def emit(self, item):
+        raise NotImplementedError
+
+    def _run_handler(self, func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            self.logger.error(f"[{func.__name__}] ERROR: {e}", exc_info=True)
+            return None
+
+    def dispatch_command_handlers(self, cmd, response):
+        per_command, per_batch = self.handlers_for(type(cmd))
+        handle_pass = True
+        for func in per_command:
+            handle_pass = self._run_handler(func, cmd, response) and handle_pass
+        for func in per_batch:
+            handle_pass = self._run_handler(func, [cmd]) and handle_pass
+        return handle_pass
+
+    def dispatch_commands(self, commands):
+        """
+        Run the handlers for a group of commands. Batch handlers get every
+        command of their type in one call; the others get each command with
+        its response, which is only built when such a handler exists.
+        """
+        by_class = {}
+        for cmd in commands:
+            by_class.setdefault(type(cmd), []).append(cmd)
+
+        for cmd_class, cmds in by_class.items():
+            per_command, per_batch = self.handlers_for(cmd_class)
+            if per_command:
+                for cmd in cmds:
+                    response = cmd.response()
+                    for func in per_command:
+                        self._run_handler(func, cmd, response)
+            for func in per_batch:
+                self._run_handler(func, cmds)
+
+    def from_seconds_since_sunrise(self, seconds, now=None):
+        """The UTC epoch of a node timestamp received at ``now``."""
+        if now is None:
+            now = time.time()
+        return float(self.sunrise.resolve(seconds, now))
+
+    def to_seconds_since_sunrise(self, epoch):
+        return self.sunrise.seconds(epoch)
+
+    @handles(DataIndication, batch=True, shard=True)
+    def handle_data_report(self, cmds):
+        # one columnar batch for every indication in the recv_queue batch,
+        # decoded in a single pass and handed off in one put; the BSON handler
+        # expands it into per-sample payloads on the far side of the queue;
+        # each node's samples go out ordered by timestamp, as they always have
+        batch = decode_data_indications(cmds).sorted()
+        if not len(batch):
+            return True
+
+        now = time.time()
+        batch.freezetime = self.sunrise.resolve(batch.timestamp, now)
+        batch.localtime = now
+        self.emit(batch)
+
+        return True
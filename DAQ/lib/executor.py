@@ -0,0 +1,366 @@
+"""
+Asynchronous command execution.
+
+Command requests, whether COMMAND_REQUEST frames from a gateway or calls to
+DAQProcess.dispatch_command_request(), are queued here rather than run on
+the ingest path. The executor's own task decodes them and validates them
+with cmdreq_validate. Each gets a request_id from DAQProcess.request_id and
+that is not already taken by a queued or in-flight request, and is started
+once its node and gateway are under their caps:
+
+  daq.command_max_per_node      requests in flight per target node
+  daq.command_max_per_gateway   requests in flight per gateway; broadcasts,
+                                and unicasts to nodes without a known route
+                                (which are flooded), count against every
+                                gateway at once
+  daq.command_max_queued        requests waiting for a slot; beyond that
+                                new ones are rejected
+  daq.command_ttl               seconds a request may stay in flight,
+                                unless it carries its own ``ttl``
+
+A command function is called with ``request_id`` (when it takes one) and
+the request's ``args``; it may be a coroutine function. Every message it
+send()s with ``rreq`` set is recorded against its request. Mesh responses
+(TYPE_RES frames) with the same node and request id are correlated back to
+it, and their command responses are collected. A request is done when its
+function has returned and every node it messaged has answered. A broadcast
+collects answers until its deadline. A command that sends nothing completes
+with its return value.
+
+Completed, failed, timed-out and rejected requests are published on
+``nats.response_topic`` by the executor task, so a slow broker never holds
+up ingest.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import time
+from collections import deque
+import numpy as np
+from bson import BSON
+from DAQ.commands.protocol import Message
+from DAQ.commands.samples import SampleBatch
+from DAQ.lib.commands import cmdreq_validate
+from DAQ.util.logger import make_logger
+from DAQ.util.macs import MACS, BROADCAST
+
+logger = make_logger("CommandExecutor")
+
+#: the request whose command is running; send() records messages against it
+CURRENT = contextvars.ContextVar("command_request", default=None)
+
+ALL_GATEWAYS = "*"
+
+
+def bson_safe(value):
+    """``value`` with what BSON cannot encode turned into plain types (sample batches into row dicts)."""
+    if isinstance(value, dict):
+        return {str(key): bson_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [bson_safe(item) for item in value]
+    if isinstance(value, SampleBatch):
+        return value.rows()
+    if isinstance(value, (memoryview, bytearray)):
+        return bytes(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, bytes, bool, int, float)):
+        return value
+    return repr(value)
+
+
+class CommandRequest:
+    __slots__ = ("rqst", "request_id", "node", "gateway", "awaiting", "responses",
+                 "timer", "returned", "done")
+
+    def __init__(self, rqst, request_id, node, gateway):
+        self.rqst = rqst
+        self.request_id = request_id
+        self.node = node
+        self.gateway = gateway
+        self.awaiting = set()  # (mac slot, request_id) of messages sent with rreq
+        self.responses = []
+        self.timer = None
+        self.returned = False
+        self.done = False
+
+    def __repr__(self):
+        return f"<CommandRequest {self.request_id} {self.rqst.get('funcname')} {self.rqst.get('status')}>"
+
+
+class CommandExecutor:
+    def __init__(self, commands, timers, publish, request_ids, route=None,
+                 max_per_gateway=4, max_per_node=1, ttl=30.0, max_queued=1024):
+        self.commands = commands        # name -> callable
+        self.timers = timers
+        self.publish = publish          # coroutine function taking the encoded completion
+        self.request_ids = request_ids  # callable returning the next request id
+        self.route = route              # MAC slot -> gwid, or None when unknown
+        self.max_per_gateway = max_per_gateway
+        self.max_per_node = max_per_node
+        self.ttl = ttl
+        self.max_queued = max_queued
+
+        self.incoming = deque()   # raw COMMAND_REQUEST payloads
+        self.queued = deque()     # validated, waiting for a slot
+        self.requests = {}        # request_id -> CommandRequest, in flight
+        self.ids = set()          # request ids of queued and in-flight requests
+        self.pending = {}         # (mac slot, request_id) -> CommandRequest
+        self.per_node = {}
+        self.per_gateway = {}
+        self.completions = deque()
+
+        self._wake = asyncio.Event()
+        self._task = None
+        self.counters = dict(received=0, dispatched=0, done=0, failed=0, timeout=0, rejected=0,
+                             responses=0)
+
+    # -- intake ------------------------------------------------------------
+
+    def submit(self, raw, gwid=None):
+        """Queue an encoded COMMAND_REQUEST; decoding happens on the executor task."""
+        self.incoming.append((raw, gwid))
+        self._wake.set()
+
+    def submit_request(self, cmd_req, gwid=None):
+        """Queue a decoded command request; returns its CommandRequest."""
+        rqst = cmdreq_validate(dict(cmd_req))
+        rqst["args"] = rqst["args"] or {}
+        rqst["gwid"] = gwid
+        request = CommandRequest(rqst, self._next_request_id(), None, None)
+        rqst["request_id"] = request.request_id
+        self.counters["received"] += 1
+        if request.request_id is None:
+            self._finish(request, "rejected", error="no free request id")
+            return request
+
+        try:
+            macaddr = rqst["args"].get("macaddr")
+            request.node = BROADCAST if macaddr is None else MACS.slot(macaddr)
+        except Exception:
+            self._finish(request, "failed", error="invalid macaddr")
+            return request
+
+        gwid = self.route(request.node) if self.route is not None and request.node != BROADCAST else None
+        request.gateway = ALL_GATEWAYS if gwid is None else gwid
+
+        if len(self.queued) >= self.max_queued:
+            self._finish(request, "rejected", error="command queue full")
+            return request
+
+        self.queued.append(request)
+        self._schedule()
+        return request
+
+    def _next_request_id(self):
+        # ids wrap (DAQProcess.request_id is 16 bits): skip those still in use
+        for _ in range(len(self.ids) + 1):
+            request_id = self.request_ids()
+            if request_id not in self.ids:
+                self.ids.add(request_id)
+                return request_id
+        return None
+
+    # -- scheduling ----------------------------------------------------------
+
+    def _has_slot(self, request):
+        if self.per_node.get(request.node, 0) >= self.max_per_node:
+            return False
+        # a flooded request is in flight on every gateway
+        flooding = self.per_gateway.get(ALL_GATEWAYS, 0)
+        if request.gateway == ALL_GATEWAYS:
+            busiest = max((count for gwid, count in self.per_gateway.items() if gwid != ALL_GATEWAYS), default=0)
+        else:
+            busiest = self.per_gateway.get(request.gateway, 0)
+        return busiest + flooding < self.max_per_gateway
+
+    def _schedule(self):
+        blocked = deque()
+        while self.queued:
+            request = self.queued.popleft()
+            if self._has_slot(request):
+                self._start(request)
+            else:
+                blocked.append(request)
+        self.queued = blocked
+
+    def _start(self, request):
+        self.per_node[request.node] = self.per_node.get(request.node, 0) + 1
+        self.per_gateway[request.gateway] = self.per_gateway.get(request.gateway, 0) + 1
+        self.requests[request.request_id] = request
+
+        rqst = request.rqst
+        rqst["status"] = "dispatched"
+        rqst["dispatched_on"] = time.time()
+        ttl = rqst["ttl"] - rqst["dispatched_on"] if rqst["ttl"] is not None else self.ttl
+        request.timer = self.timers.schedule(max(ttl, 0.0), self._expire, request)
+        self.counters["dispatched"] += 1
+        asyncio.get_running_loop().create_task(self._execute(request))
+
+    def _release(self, request):
+        for counts, key in ((self.per_node, request.node), (self.per_gateway, request.gateway)):
+            if counts.get(key, 0) > 1:
+                counts[key] -= 1
+            else:
+                counts.pop(key, None)
+
+    async def _execute(self, request):
+        rqst = request.rqst
+        func = self.commands.get(rqst["funcname"])
+        if func is None:
+            self._finish(request, "failed", error=f"Unknown command: {rqst['funcname']}")
+            return
+
+        args = dict(rqst["args"])
+        if "request_id" in inspect.signature(func).parameters:
+            args["request_id"] = request.request_id
+
+        token = CURRENT.set(request)
+        try:
+            result = func(**args)
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as e:
+            logger.exception(f"[COMMAND] Error executing {rqst['funcname']}")
+            self._finish(request, "failed", error=str(e))
+            return
+        finally:
+            CURRENT.reset(token)
+
+        request.returned = True
+        if not request.awaiting:
+            self._finish(request, "done", result)
+
+    # -- correlation ---------------------------------------------------------
+
+    def track(self, message):
+        """Record a message sent by the running command, if it asks for a response."""
+        request = CURRENT.get()
+        if request is None or request.done or not message.mesh_ctrl.rreq:
+            return
+        key = (message.mac, message.request_id)
+        self.pending[key] = request
+        request.awaiting.add(key)
+
+    def expects(self, message):
+        """Whether a received message answers a pending request (header only)."""
+        return bool(self.pending) and message.dtype == Message.TYPE_RES \
+            and ((message.mac, message.request_id) in self.pending
+                 or (BROADCAST, message.request_id) in self.pending)
+
+    def correlate(self, message):
+        """Attach a response message to its request; completes the request once all answers are in."""
+        key = (message.mac, message.request_id)
+        request = self.pending.get(key)
+        if request is None:
+            key = (BROADCAST, message.request_id)
+            request = self.pending.get(key)
+            if request is None:
+                return None
+
+        request.responses.extend(message.responses())
+        self.counters["responses"] += 1
+        if key[0] != BROADCAST:
+            # a broadcast keeps collecting answers until its deadline
+            del self.pending[key]
+            request.awaiting.discard(key)
+            if not request.awaiting and request.returned:
+                self._finish(request, "done")
+        return request
+
+    def dispatch_command_response(self, request_id, response=None):
+        """Complete a request explicitly, e.g. from a command that answers on its own."""
+        request = self.requests.get(request_id)
+        if request is not None:
+            if response is not None:
+                request.responses.append(response)
+            self._finish(request, "done")
+
+    def _expire(self, request):
+        if request.done:
+            return
+        answered_broadcast = request.responses and all(key[0] == BROADCAST for key in request.awaiting)
+        if answered_broadcast or (request.returned and not request.awaiting):
+            self._finish(request, "done")
+        else:
+            self._finish(request, "timeout", error="no response before ttl")
+
+    # -- completion ----------------------------------------------------------
+
+    def _finish(self, request, status, result=None, error=None):
+        if request.done:
+            return
+        request.done = True
+        if request.timer is not None:
+            request.timer.cancel()
+        for key in request.awaiting:
+            self.pending.pop(key, None)
+        if self.requests.pop(request.request_id, None) is not None:
+            self._release(request)
+        self.ids.discard(request.request_id)
+
+        rqst = request.rqst
+        rqst["status"] = status
+        rqst["completed_on"] = time.time()
+        rqst["responses"] = request.responses
+        if result is not None:
+            rqst["result"] = result
+        if error is not None:
+            rqst["error"] = error
+        self.counters[status] += 1
+
+        self.completions.append(rqst)
+        self._wake.set()
+        if self.queued:
+            self._schedule()
+
+    # -- executor task -------------------------------------------------------
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+
+            # one bad request or completion must not stop the task
+            while self.incoming:
+                raw, gwid = self.incoming.popleft()
+                try:
+                    self.submit_request(BSON(raw).decode(), gwid)
+                except Exception:
+                    logger.exception(f"[COMMAND] Could not queue command request from {gwid}")
+
+            while self.completions:
+                rqst = self.completions.popleft()
+                try:
+                    await self._publish(rqst)
+                except Exception:
+                    logger.exception(f"[COMMAND] Could not publish completion of {rqst.get('request_id')}")
+
+    async def _publish(self, rqst):
+        try:
+            payload = BSON.encode(rqst)
+        except Exception:
+            rqst["responses"] = bson_safe(rqst.get("responses"))
+            rqst["result"] = bson_safe(rqst.get("result"))
+            payload = BSON.encode(rqst)
+        await self.publish(payload)
+
+    def stats(self):
+        return dict(self.counters, queued=len(self.queued), in_flight=len(self.requests),
+                    pending_responses=len(self.pending))
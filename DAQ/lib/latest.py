@@ -0,0 +1,113 @@
+"""
+Live latest-value table of the fleet.
+
+LatestTable keeps one row per MAC registry slot in plain NumPy columns:
+the last Vi .. Po, op_stat, reg_stat and hopcount of every node and the
+freezetime (UTC epoch) of the sample they came from. Each SampleBatch
+updates it in place with a few vectorised assignments. The newest sample
+of each node in the batch wins, and a sample older than the row already
+holds is ignored, so late retransmissions do not roll a node back.
+
+DAQProcess feeds the table from the batches it hands to the data handler
+chain, and serves it on the ``nats.latest_topic`` request/reply subject.
+A request is a BSON document, empty for the whole fleet, or filtered with
+any of:
+
+  macs     MAC addresses in any textual form
+  fields   column names to include (default all)
+  since    only nodes updated at or after this epoch
+
+The reply is one bz2-compressed BSON document::
+
+  {"time": <epoch>, "count": <nodes>,
+   "columns": {"mac": <bytes>, "Vi": <bytes>, ...},
+   "dtypes": {"mac": "<u8", "Vi": "<f8", ...}}
+
+Each column is the raw little-endian array, so a dashboard can load it
+with ``numpy.frombuffer(columns[name], dtypes[name])``. ``mac`` holds the
+addresses as integers, and ``"%016X" % mac`` gives their usual text form.
+"""
+
+import bz2
+import time
+import numpy as np
+from bson import BSON
+from DAQ.commands.samples import SCALED_FIELDS
+from DAQ.util.macs import MACS
+
+COLUMNS = tuple((name, "<f8") for name in SCALED_FIELDS) + (
+    ("op_stat", "<u2"), ("reg_stat", "<u2"), ("hopcount", "u1"), ("timestamp", "<f8"))
+
+
+class LatestTable:
+    def __init__(self, capacity=1024):
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        self.columns["timestamp"][:] = -np.inf  # never seen
+        self.size = 0
+        self.updates = 0
+
+    def __len__(self):
+        """Nodes with at least one sample."""
+        return int(np.count_nonzero(self.columns["timestamp"][:self.size] > -np.inf))
+
+    def _reserve(self, size):
+        capacity = len(self.columns["timestamp"])
+        if size > capacity:
+            capacity = max(size, 2 * capacity)
+            for name, column in self.columns.items():
+                grown = np.full(capacity, -np.inf if name == "timestamp" else 0, dtype=column.dtype)
+                grown[:len(column)] = column
+                self.columns[name] = grown
+        self.size = max(self.size, size)
+
+    def update(self, batch):
+        """Apply a stamped SampleBatch; returns how many rows changed."""
+        index = np.flatnonzero(batch.mac >= 0)
+        if not len(index):
+            return 0
+
+        # the newest sample of each node: order by node, then time, then arrival
+        mac, times = batch.mac[index], batch.freezetime[index]
+        order = np.lexsort((index, times, mac))
+        grouped = mac[order]
+        last = index[order[np.append(grouped[1:] != grouped[:-1], True)]]
+
+        slots = batch.mac[last]
+        self._reserve(int(slots.max()) + 1)
+        columns = self.columns
+        newer = batch.freezetime[last] >= columns["timestamp"][slots]
+        last, slots = last[newer], slots[newer]
+
+        for name in SCALED_FIELDS + ("op_stat", "reg_stat", "hopcount"):
+            columns[name][slots] = getattr(batch, name)[last]
+        columns["timestamp"][slots] = batch.freezetime[last]
+        self.updates += len(slots)
+        return len(slots)
+
+    def snapshot(self, macs=None, fields=None, since=None):
+        """Column arrays for every node seen, or for a filtered slice; ``mac`` is always included."""
+        if macs is None:
+            slots = np.arange(self.size)
+        else:
+            slots = [MACS.find(mac) for mac in macs]
+            slots = np.array([slot for slot in slots if slot is not None and slot < self.size], dtype=np.intp)
+
+        seen = self.columns["timestamp"][slots]
+        slots = slots[seen >= since if since is not None else seen > -np.inf]
+
+        names = [name for name, _ in COLUMNS] if fields is None else [name for name in fields if name in self.columns]
+        snapshot = {"mac": np.frombuffer(b"".join(MACS.wire[slot] for slot in slots.tolist()), dtype="<u8")}
+        for name in names:
+            snapshot[name] = self.columns[name][slots]
+        return snapshot
+
+    def encode(self, request=None, now=None):
+        """The compressed reply to a snapshot request (a decoded BSON dict, or None for everything)."""
+        request = request or {}
+        snapshot = self.snapshot(request.get("macs"), request.get("fields"), request.get("since"))
+        return bz2.compress(BSON.encode({
+            "time": time.time() if now is None else now,
+            "count": len(snapshot["mac"]),
+            "columns": {name: column.tobytes() for name, column in snapshot.items()},
+            "dtypes": {name: column.dtype.str for name, column in snapshot.items()},
+        }))
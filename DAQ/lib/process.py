@@ -2,30 +2,33 @@ import os
 import random
 import shutil
 import asyncio
-from datetime import datetime, time as dtime, timedelta, timezone, UTC
+import time
 from bson import BSON
-from DAQ.commands.protocol import Message, DataIndication
+from DAQ.commands.protocol import Message
+from DAQ.commands.samples import SampleBatch, utc_datetime
 from DAQ.commands.strategy import CMD_FUNCS, MeshCommands
-from DAQ.util.handlers.common import BSONHandler, CompressionHandler, IHandler, HandlerManager
+from DAQ.util.handlers.common import BSONHandler, CompressionHandler, IHandler, HandlerManager, RecordBatch, handoff
 from DAQ.services.core.data.pitcher import Pitcher
 from DAQ.services.core.collector.collector import DeviceCollector
-from DAQ.util.config import load_config
+from DAQ.util.config import load_config, get_topic
 from DAQ.util.hex import _h
 from DAQ.util.logger import make_logger
+from DAQ.util.macs import MACS
 from DAQ.util.process.base import ProcessBase
 from DAQ.gateway.manager import GatewayManager
+from DAQ.gateway.ingest import IngestEnvelope, IngestQueue
+from DAQ.gateway.reassembly import Reassembler
+from DAQ.util.timers import TimerWheel
+from DAQ.lib.dispatch import CommandDispatcher, ALL, CORE, sunrise_anchor
+from DAQ.lib.shards import ShardPool
+from DAQ.lib.latest import LatestTable
+from DAQ.lib.staleness import StalenessMonitor
+from DAQ.lib.executor import CommandExecutor
+from DAQ.util.brokers.broker import local_nats_broker
 
 cfg = load_config()
 logger = make_logger("DAQProcess")
 
-CMD_HANDLERS = {}
-
-def handles(cmd_class):
-    def decorator(fn):
-        CMD_HANDLERS.setdefault(fn.__name__, []).append(cmd_class)
-        return fn
-    return decorator
-
 def cleanup_temp_files():
     for path in ["/tmp", "/dev/shm"]:
         for f in os.listdir(path):
@@ -38,11 +41,7 @@ def cleanup_temp_files():
             except Exception:
                 pass
 
-def sunrise_today():
-    today = datetime.now(UTC).date()
-    return datetime.combine(today, dtime(6, 0), tzinfo=UTC)
-
-class DAQProcess(ProcessBase, MeshCommands):
+class DAQProcess(ProcessBase, MeshCommands, CommandDispatcher):
     MAX_REQUEST_ID = 65535
 
     def __init__(self):
@@ -50,13 +49,45 @@ class DAQProcess(ProcessBase, MeshCommands):
         self.logger = make_logger(self.__class__.__name__)
         self._request_id = random.randrange(0, self.MAX_REQUEST_ID)
         self._make_map()
-        self.sunrise = sunrise_today()
-        self.requests = {}
-        self.last_device_data = {}
+        self.shard_count = cfg.get("daq", {}).get("shards", 0)
+        self.shards = None
+        self._make_dispatch(CORE if self.shard_count > 1 else ALL)
+        self.sunrise = sunrise_anchor(cfg)
+        self.latest = LatestTable()
+
+        self.throttle_delay = cfg.get("daq", {}).get("throttle_delay", 0.01)
+        self.backpressure_threshold = cfg.get("daq", {}).get("backpressure_qsize", 10)
+        self.backpressure_policy = cfg.get("daq", {}).get("backpressure_policy", IngestQueue.PAUSE)
+
+        self.batch_max = cfg.get("daq", {}).get("batch_max", 1024)
+        self.batch_latency = cfg.get("daq", {}).get("batch_latency", 0.0)
+        self.handoff_min_samples = cfg.get("daq", {}).get("handoff_min_samples", 32)
+
+        self.recv_queue = IngestQueue(self.backpressure_threshold,
+                                      policy=self.backpressure_policy,
+                                      spill_path=cfg.get("daq", {}).get("spill_path"))
 
-        self.recv_queue = asyncio.Queue()
+        self.timers = TimerWheel(cfg.get("daq", {}).get("timer_tick", 1.0),
+                                 cfg.get("daq", {}).get("timer_slots", 512),
+                                 cfg.get("daq", {}).get("timer_levels", 4))
 
-        self.gateway_manager = GatewayManager(cfg['gateway']['comm_host'], cfg['gateway']['comm_port'], self.recv_queue)
+        self.gateway_manager = GatewayManager(cfg['gateway']['comm_host'], cfg['gateway']['comm_port'],
+                                              self.recv_queue, timers=self.timers)
+
+        self.reassembly = Reassembler(self.timers,
+                                      cfg.get("daq", {}).get("reassembly_timeout", 30.0),
+                                      cfg.get("daq", {}).get("reassembly_max_bytes", 4 * 1024 * 1024))
+
+        self.executor = CommandExecutor(self.CMD_MAPPER, self.timers, self.publish_response, lambda: self.request_id,
+                                        route=self.gateway_for,
+                                        max_per_gateway=cfg.get("daq", {}).get("command_max_per_gateway", 4),
+                                        max_per_node=cfg.get("daq", {}).get("command_max_per_node", 1),
+                                        ttl=cfg.get("daq", {}).get("command_ttl", 30.0),
+                                        max_queued=cfg.get("daq", {}).get("command_max_queued", 1024))
+        self.requests = self.executor.requests  # request_id -> CommandRequest in flight
+
+        stale_after = cfg.get("daq", {}).get("stale_after", 900.0)
+        self.staleness = StalenessMonitor(self.timers, stale_after, self.on_stale) if stale_after else None
 
         # Handler chain: BSON → Compression → Pitcher
         self.pitcher = Pitcher(IHandler.GENERIC)
@@ -71,9 +102,6 @@ class DAQProcess(ProcessBase, MeshCommands):
         self.collector_manager = HandlerManager()
         self.collector_manager.add_handler(self.collector)
 
-        self.throttle_delay = cfg.get("daq", {}).get("throttle_delay", 0.01)
-        self.backpressure_threshold = cfg.get("daq", {}).get("backpressure_qsize", 10)
-
         try:
             self.compression.set('batch_on', cfg.get("daq", {}).get("compression", {}).get("batch_on", 4))
             self.compression.set('batch_at', cfg.get("daq", {}).get("compression", {}).get("batch_at", 0.5))
@@ -100,14 +128,77 @@ class DAQProcess(ProcessBase, MeshCommands):
         self._request_id = (self._request_id + 1) % self.MAX_REQUEST_ID
         return self._request_id
 
+    def send(self, msg):
+        """Queue a mesh message on the gateways: all of them for broadcasts, the routed one otherwise."""
+        self.executor.track(msg)
+        if msg.is_broadcast():
+            return self.gateway_manager.send_all(msg)
+        return self.gateway_manager.send_unicast(msg)
+
+    def gateway_for(self, mac):
+        route = self.gateway_manager.routes.lookup(mac)
+        return route.gwid if route is not None else None
+
+    async def publish_response(self, payload):
+        await local_nats_broker.publish(get_topic("response"), payload)
+
+    def dispatch_command_response(self, request_id, response=None):
+        self.executor.dispatch_command_response(request_id, response)
+
+    def emit(self, item):
+        # every SampleBatch passes here, from the workers too in sharded mode
+        if isinstance(item, SampleBatch):
+            self.latest.update(item)
+            if self.staleness is not None:
+                self.staleness.seen(item.mac)
+            item = handoff(item, self.handoff_min_samples)
+        self.data_handler.data_queue.put(item)
+
+    def on_stale(self, slot, state, silent_for):
+        """Hand a node staleness alert to the data handler chain as an ``alert`` record."""
+        macaddr = MACS.text(slot)
+        if state == "stale":
+            self.logger.warning(f"[STALE] {macaddr} silent for {silent_for:.0f}s")
+        self.data_handler.data_queue.put(dict(type="alert", alert=state, macaddr=macaddr,
+                                              freezetime=utc_datetime(float(self.latest.columns["timestamp"][slot])),
+                                              localtime=utc_datetime(time.time()), silent_for=silent_for))
+
+    async def on_latest_request(self, msg):
+        """Reply to a latest-value snapshot request (see DAQ.lib.latest)."""
+        try:
+            request = BSON(msg.data).decode() if msg.data else {}
+            await msg.respond(self.latest.encode(request))
+        except Exception:
+            self.logger.exception("[LATEST] Snapshot request failed")
+
+    def forward(self, envelopes):
+        """Dispatch the commands of envelopes a shard worker sent back to the core's handlers."""
+        self.dispatch_commands([cmd for envelope in envelopes for cmd in envelope.commands])
+
     async def start(self):
         self.logger.info("DAQProcess starting gateway and handlers")
+        if self.shard_count > 1:
+            core_classes = frozenset(cls for cls, handlers in self.HANDLER_MAP.items() if any(handlers))
+            self.shards = ShardPool(self.shard_count, self.emit, self.forward, core_classes,
+                                    cfg.get("daq", {}).get("shard_inflight", 8))
+            await self.shards.start()
         await self.gateway_manager.start()
+        self.timers.start()
+        self.executor.start()
+        try:
+            latest_topic = get_topic("latest")
+            if not latest_topic:
+                raise ValueError("nats.latest_topic is not configured")
+            await local_nats_broker.subscribe(latest_topic, self.on_latest_request)
+        except Exception as e:
+            self.logger.error(f"Latest-value endpoint unavailable: {e}")
         self.data_handler.start(subhandlers=True)
         self.collector.start(subhandlers=True)
 
     async def stop(self):
         self.logger.info("DAQProcess stopping...")
+        self.timers.stop()
+        await self.executor.stop()
         try:
             self.data_handler.stop(subhandlers=True)
         except Exception:
@@ -120,6 +211,17 @@ class DAQProcess(ProcessBase, MeshCommands):
             await self.gateway_manager.stop()
         except Exception:
             self.logger.exception("gateway_manager stop failed")
+        if self.shards is not None:
+            self.shards.close()
+            await self.shards.wait_closed()
+            self.logger.info(f"Shards: {self.shards.stats()}")
+        self.logger.info(f"Ingest queue: {self.recv_queue.stats()}")
+        self.logger.info(f"Reassembly: {self.reassembly.stats()}")
+        self.logger.info(f"Commands: {self.executor.stats()}")
+        self.logger.info(f"Timers: {self.timers.stats()}")
+        if self.staleness is not None:
+            self.logger.info(f"Staleness: {self.staleness.stats()}")
+        self.recv_queue.close()
         cleanup_temp_files()
 
     async def run(self):
@@ -127,16 +229,54 @@ class DAQProcess(ProcessBase, MeshCommands):
         try:
             self.logger.info("DAQProcess entering async run loop...")
             while True:
-                payload = await self.recv_queue.get()
-                await self.process_gateway_indication(payload)
+                batch = await self.recv_queue.get_batch(self.batch_max, self.batch_latency)
+                await self.process_batch(batch)
         except asyncio.CancelledError:
             self.logger.info("DAQProcess cancelled.")
         finally:
             await self.stop()
 
-    async def process_gateway_indication(self, payload):
+    async def process_batch(self, batch):
+        """
+        Handle one recv_queue batch as a unit: the commands of every frame
+        in it are dispatched together, so batch handlers run once per batch,
+        and records bound for the data handler go over in a single put. In
+        sharded mode the batch is one round of the ShardPool.
+        """
+        if self.shards is not None:
+            await self.shards.wait_ready()
+
+        commands, records = [], RecordBatch()
+        for payload in batch:
+            await self.process_gateway_indication(payload, commands, records)
+        if commands:
+            self.dispatch_commands(commands)
+        if self.shards is not None:
+            # frames went to the workers; the round releases records in order
+            self.shards.submit(records)
+        elif records:
+            self.emit(records)
+
+    async def process_gateway_indication(self, payload, commands=None, records=None):
+        """
+        Handle one payload. With ``commands`` and ``records`` lists, decoded
+        commands and data records are collected there for the caller to
+        dispatch and hand off; without, they are dispatched right away.
+        """
+        if isinstance(payload, IngestEnvelope):
+            self.process_envelope(payload, commands)
+            return
+
+        if isinstance(payload, list):
+            for item in payload:
+                await self.process_gateway_indication(item, commands, records)
+            return
+
         if isinstance(payload, dict):
-            self.data_handler.data_queue.put(payload)
+            if records is None:
+                self.emit(payload)
+            else:
+                records.append(payload)
             return
 
         try:
@@ -147,76 +287,50 @@ class DAQProcess(ProcessBase, MeshCommands):
 
         if msg_type == Message.MESH_INDICATION:
             try:
-                msg = Message.from_raw(msg_type, length, raw, received_on)
+                envelope = IngestEnvelope.decode(gwid, msg_type, length, raw, received_on)
             except Exception:
                 self.logger.critical("Unable to parse MESH_INDICATION: [%s,%s,%s]" % (msg_type, length, _h(raw)))
                 return
-            for command in msg.commands:
-                self.command_response(command, gwid)
+            self.process_envelope(envelope, commands)
 
         elif msg_type == Message.COMMAND_REQUEST:
-            cmd_req = BSON(raw).decode()
-            self.dispatch_command_request(cmd_req, gwid=gwid)
+            # decoded and run by the executor task, off the ingest path
+            self.executor.submit(raw, gwid)
+
+    def process_envelope(self, envelope, commands=None):
+        self.gateway_manager.observe(envelope)
+
+        if self.executor.expects(envelope.message):
+            # a response to a command in flight; consumed here, in sharded mode too
+            message = envelope.message
+            if message.is_multipart():
+                message = self.reassembly.add(message)
+                if message is None:
+                    return
+            self.executor.correlate(message)
+            return
+
+        if self.shards is not None:
+            self.shards.route(envelope)
+            if commands is None:
+                self.shards.submit()
+            return
+
+        if envelope.message.is_multipart():
+            message = self.reassembly.add(envelope.message)
+            if message is None:
+                return
+            envelope.message = message
+
+        if commands is None:
+            self.dispatch_commands(envelope.commands)
+        else:
+            commands.extend(envelope.commands)
 
     def command_response(self, cmd, gwid=None):
         response = cmd.response()
         self.dispatch_command_handlers(cmd, response)
 
     def dispatch_command_request(self, cmd_req, gwid=None):
-        func_name = cmd_req.get("func")
-        args = cmd_req.get("args", {}) or {}
-        func = self.CMD_MAPPER.get(func_name)
-        if not func:
-            self.logger.warning(f"[COMMAND] Unknown command: {func_name}")
-            return {"status": False, "msg": "Unknown command"}
-        try:
-            return func(**args)
-        except Exception as e:
-            self.logger.exception(f"[COMMAND] Error executing {func_name}")
-            return {"status": False, "msg": f"Error: {str(e)}"}
-
-    def dispatch_command_handlers(self, cmd, response):
-        handle_pass = True
-        for handler_name, cmd_classes in CMD_HANDLERS.items():
-            for klass in cmd_classes:
-                if isinstance(cmd, klass):
-                    func = getattr(self, handler_name, None)
-                    if func:
-                        try:
-                            handle_pass = handle_pass and func(cmd, response)
-                        except Exception as e:
-                            self.logger.error(f"[{handler_name}] ERROR: {e}", exc_info=True)
-        return handle_pass
-
-    def from_seconds_since_sunrise(self, seconds):
-        return self.sunrise + timedelta(seconds=seconds)
-
-    def to_seconds_since_sunrise(self, dt):
-        return min(int((dt - self.sunrise).total_seconds()), 0xFFFE)
-
-    @handles(DataIndication)
-    def handle_data_report(self, cmd, response):
-        if 'reg_stat' not in response or 'op_stat' not in response:
-            return False
-
-        for data in response['data']:
-            freezetime = self.from_seconds_since_sunrise(data['timestamp'])
-
-            payload = dict(
-                type=response['type'],
-                macaddr=response['macaddr'],
-                freezetime=freezetime,
-                localtime=datetime.now(timezone.utc),
-                reg_stat=response['reg_stat'],
-                op_stat=response['op_stat'],
-                Vi=data['Vi'],
-                Vo=data['Vo'],
-                Ii=data['Ii'],
-                Io=data['Io'],
-                Pi=data['Pi'],
-                Po=data['Po']
-            )
-            self.data_handler.data_queue.put(payload)
-            self.last_device_data[payload['type']] = payload
-
-        return True
+        """Queue a command request on the executor; returns the validated request with its request_id."""
+        return self.executor.submit_request(cmd_req, gwid).rqst
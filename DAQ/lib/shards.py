@@ -0,0 +1,307 @@
+"""
+Sharded DAQ workers.
+
+With ``daq.shards: N`` (N > 1) the DAQ core keeps the gateway side (route
+observation, command requests, the data handler chain) and hands every frame
+to one of N worker processes, picked by a hash of the node's MAC. A worker
+owns all per-node state for its share of the nodes: multi-part reassembly
+and the shard handlers (``handles(..., shard=True)``) with whatever they
+keep. Workers share nothing, so nothing is locked. The latest-value table
+(DAQ.lib.latest) stays in the core, fed from the merged stream, and
+duplicate suppression (DAQ.gateway.dedupe) stays at the gateway side, which
+drops retransmissions before frames are routed to a worker.
+
+Each recv_queue batch is one numbered round. The core sends every worker its
+share of the round; each worker answers with the records its handlers
+emitted, plus the envelopes holding commands that handlers in the core must
+see. Rounds are released strictly in order once every worker in them has
+answered, whichever worker finished first. Within a round, the core's own
+records come first, then each worker's output in worker order. Order is
+therefore kept per round and per node, since a node's frames all go to one
+worker, which handles them in the order received. It is not kept across
+nodes within a round.
+
+At most ``daq.shard_inflight`` rounds are outstanding; beyond that the DAQ
+loop waits, which backs up recv_queue and applies its backpressure policy.
+"""
+
+import asyncio
+import multiprocessing
+import signal
+import zlib
+from collections import OrderedDict, deque
+from DAQ.lib.dispatch import CommandDispatcher, SHARD, sunrise_anchor
+from DAQ.lib.encoding import encode_obj, decode_obj
+from DAQ.gateway.reassembly import Reassembler
+from DAQ.util.config import load_config
+from DAQ.util.logger import make_logger
+from DAQ.util.macs import MACS
+from DAQ.util.timers import TimerWheel
+
+cfg = load_config()
+logger = make_logger("shards")
+
+
+def shard_entrypoint(index, conn, out_conn, core_classes):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        ShardWorker(index, core_classes).serve(conn, out_conn)
+    except (BrokenPipeError, EOFError):
+        pass
+
+
+class ShardWorker(CommandDispatcher):
+    """The dispatch loop of one worker process."""
+
+    def __init__(self, index, core_classes=frozenset()):
+        self.index = index
+        self.core_classes = core_classes
+        self.logger = make_logger(f"DAQShard-{index}")
+        self.sunrise = sunrise_anchor(cfg)
+        self.outbox = []
+
+        self.timers = TimerWheel(cfg.get("daq", {}).get("timer_tick", 1.0),
+                                 cfg.get("daq", {}).get("timer_slots", 512),
+                                 cfg.get("daq", {}).get("timer_levels", 4))
+        self.reassembly = Reassembler(self.timers,
+                                      cfg.get("daq", {}).get("reassembly_timeout", 30.0),
+                                      cfg.get("daq", {}).get("reassembly_max_bytes", 4 * 1024 * 1024))
+        self._make_dispatch(SHARD)
+
+    def emit(self, item):
+        self.outbox.append(item)
+
+    def process_round(self, envelopes):
+        """Dispatch one round; returns ``(records, forward)`` for the core."""
+        commands, forward = [], []
+        for envelope in envelopes:
+            if envelope.message.is_multipart():
+                message = self.reassembly.add(envelope.message)
+                if message is None:
+                    continue
+                envelope.message = message
+
+            cmds = envelope.commands
+            commands.extend(cmds)
+            if self.core_classes and any(type(cmd) in self.core_classes for cmd in cmds):
+                forward.append(envelope)
+
+        self.dispatch_commands(commands)
+        records, self.outbox = self.outbox, []
+        return records, forward
+
+    def serve(self, conn, out_conn):
+        logger.info(f"[SHARD {self.index}] dispatching")
+        while True:
+            if conn.poll(self.timers.tick):
+                seq, envelopes = decode_obj(conn.recv_bytes())
+                records, forward = self.process_round(envelopes)
+                out_conn.send_bytes(encode_obj((seq, records, forward)))
+            self.timers.advance()
+
+
+class Round:
+    __slots__ = ("waiting", "results", "records")
+
+    def __init__(self, waiting, records):
+        self.waiting = waiting
+        self.results = {}
+        self.records = records
+
+
+class ShardLink:
+    """Core-side end of one worker's pair of pipes."""
+
+    def __init__(self, index, conn, out_conn, pool, loop):
+        self.index = index
+        self.conn = conn
+        self.out_conn = out_conn
+        self.pool = pool
+        self.loop = loop
+        self.closed = False
+
+        self.pending = deque()
+        self._wake = asyncio.Event()
+        self._task = loop.create_task(self._forward())
+        loop.add_reader(out_conn.fileno(), self._on_readable)
+
+    def queue(self, seq, envelopes):
+        self.pending.append((seq, envelopes))
+        self._wake.set()
+
+    async def _forward(self):
+        # sends run in the executor so the loop keeps draining results while a
+        # worker is busy; one task per link keeps its rounds in order
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                while self.pending:
+                    await self.loop.run_in_executor(None, self.conn.send_bytes, encode_obj(self.pending.popleft()))
+        except (BrokenPipeError, OSError):
+            logger.warning(f"[SHARD {self.index}] Pipe closed")
+            self.close()
+
+    def _on_readable(self):
+        # poll() only says a result has started to arrive, and copying a large
+        # round takes a while: read it in the executor, not on the DAQ loop
+        self.loop.remove_reader(self.out_conn.fileno())
+        self.loop.create_task(self._read())
+
+    async def _read(self):
+        try:
+            while self.out_conn.poll():
+                seq, records, forward = await self.loop.run_in_executor(None, self._receive)
+                self.pool.complete(seq, self.index, records, forward)
+        except (EOFError, OSError):
+            logger.warning(f"[SHARD {self.index}] Pipe closed")
+            self.close()
+            return
+        if not self.closed:
+            self.loop.add_reader(self.out_conn.fileno(), self._on_readable)
+
+    def _receive(self):
+        return decode_obj(self.out_conn.recv_bytes())
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.loop.remove_reader(self.out_conn.fileno())
+            self._task.cancel()
+            self.conn.close()
+            self.out_conn.close()
+            self.pool.abandon(self.index)
+
+
+class ShardPool:
+    """
+    Spawns the workers, routes frames to them and merges what they send
+    back. ``emit(item)`` receives the merged records in order;
+    ``forward(envelopes)`` receives envelopes for the core's own handlers.
+    """
+
+    def __init__(self, count, emit, forward, core_classes=frozenset(), inflight=8):
+        self.count = count
+        self.emit = emit
+        self.forward = forward
+        self.core_classes = core_classes
+        self.inflight = inflight
+        self.processes = []
+        self.links = []
+
+        self.shards = []  # MAC slot -> worker index
+        self.parts = [[] for _ in range(count)]
+        self.sequence = 0
+        self.rounds = OrderedDict()  # oldest first
+        self._space = asyncio.Event()
+        self._space.set()
+        self.counters = dict(rounds=0, frames=0, abandoned=0)
+
+    async def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        loop = asyncio.get_running_loop()
+
+        for index in range(self.count):
+            reader, writer = ctx.Pipe(duplex=False)
+            out_reader, out_writer = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=shard_entrypoint, args=(index, reader, out_writer, self.core_classes),
+                               name=f"DAQShard-{index}", daemon=True)
+            proc.start()
+            reader.close()
+            out_writer.close()
+
+            self.processes.append(proc)
+            self.links.append(ShardLink(index, writer, out_reader, self, loop))
+            logger.info(f"[SHARD {index}] Started PID {proc.pid}")
+
+    def shard_for(self, slot):
+        """The worker that owns a MAC slot: a CRC-32 of its wire address, so it is the same in every process."""
+        shards = self.shards
+        while len(shards) <= slot:
+            shards.append(zlib.crc32(MACS.wire[len(shards)]) % self.count)
+        return shards[slot] if slot >= 0 else 0
+
+    def route(self, envelope):
+        """Add a frame to the current round."""
+        self.parts[self.shard_for(envelope.message.mac)].append(envelope)
+
+    async def wait_ready(self):
+        """Wait until fewer than ``inflight`` rounds are outstanding."""
+        while len(self.rounds) >= self.inflight:
+            self._space.clear()
+            await self._space.wait()
+
+    def submit(self, records=None):
+        """
+        Close the current round and send each worker its share. ``records``
+        produced by the core for the same batch are released with it.
+        """
+        self.sequence += 1
+        waiting = set()
+        for index, part in enumerate(self.parts):
+            if not part:
+                continue
+            self.counters["frames"] += len(part)
+            if self.links[index].closed:
+                self.counters["abandoned"] += len(part)
+                continue
+            self.links[index].queue(self.sequence, part)
+            waiting.add(index)
+
+        self.parts = [[] for _ in range(self.count)]
+        self.rounds[self.sequence] = Round(waiting, records)
+        self.counters["rounds"] += 1
+        self._release()
+
+    def complete(self, seq, index, records, forward):
+        pending = self.rounds.get(seq)
+        if pending is not None:
+            pending.waiting.discard(index)
+            pending.results[index] = (records, forward)
+            self._release()
+
+    def abandon(self, index):
+        """A worker went away: stop waiting on it."""
+        for pending in self.rounds.values():
+            if index in pending.waiting:
+                pending.waiting.discard(index)
+                self.counters["abandoned"] += 1
+        self._release()
+
+    def _release(self):
+        while self.rounds:
+            seq, pending = next(iter(self.rounds.items()))
+            if pending.waiting:
+                break
+            del self.rounds[seq]
+
+            if pending.records:
+                self.emit(pending.records)
+            # worker by worker: per-node order holds, arrival order across workers does not
+            for index in sorted(pending.results):
+                records, forward = pending.results[index]
+                for item in records:
+                    self.emit(item)
+                if forward:
+                    self.forward(forward)
+
+        if len(self.rounds) < self.inflight:
+            self._space.set()
+
+    def stats(self):
+        return dict(self.counters, shards=self.count, inflight=len(self.rounds),
+                    alive=sum(not link.closed for link in self.links))
+
+    def close(self):
+        for link in self.links:
+            link.close()
+        for proc in self.processes:
+            if proc.is_alive():
+                proc.terminate()
+
+    async def wait_closed(self):
+        loop = asyncio.get_running_loop()
+        for proc in self.processes:
+            await loop.run_in_executor(None, proc.join, 5)
+        self.processes = []
+        self.links = []
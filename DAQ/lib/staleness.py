@@ -0,0 +1,77 @@
+"""
+Device staleness alerts.
+
+StalenessMonitor notices nodes that stop reporting. DAQProcess marks the
+nodes of every SampleBatch it hands on as heard. A node not heard for
+``daq.stale_after`` seconds raises one ``stale`` alert, and one
+``recovered`` alert when it reports again. As in the routing table, each
+node holds a single timer on the shared TimerWheel. The timer re-arms itself
+for the remaining time when the node has been heard since, so the steady
+stream of samples writes a NumPy column and never touches the wheel.
+"""
+
+import numpy as np
+from DAQ.util.timers import TimerWheel
+
+
+class StalenessMonitor:
+    def __init__(self, timers: TimerWheel, after=900.0, alert=None, capacity=1024):
+        self.timers = timers
+        self.after = after
+        self.alert = alert  # alert(slot, "stale" | "recovered", seconds silent)
+        self.last_seen = np.zeros(capacity)
+        self.armed = np.zeros(capacity, dtype=bool)
+        self.stale = np.zeros(capacity, dtype=bool)
+        self.counters = dict(alerts=0, recovered=0)
+
+    def __len__(self):
+        """Nodes currently stale."""
+        return int(np.count_nonzero(self.stale))
+
+    def _reserve(self, size):
+        capacity = len(self.last_seen)
+        if size > capacity:
+            capacity = max(size, 2 * capacity)
+            for name in ("last_seen", "armed", "stale"):
+                column = getattr(self, name)
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:len(column)] = column
+                setattr(self, name, grown)
+
+    def seen(self, slots, now=None):
+        """Mark MAC registry slots (an array, repeats allowed) as heard at ``now`` on the wheel's clock."""
+        slots = np.unique(slots[slots >= 0])
+        if not len(slots):
+            return
+        now = self.timers.clock() if now is None else now
+        self._reserve(int(slots[-1]) + 1)
+
+        arming = slots[~self.armed[slots]]
+        recovering = arming[self.stale[arming]]
+        silent = now - self.last_seen[recovering]
+        self.last_seen[slots] = now
+
+        for slot in arming.tolist():
+            self.armed[slot] = True
+            self.timers.schedule(self.after, self._check, slot)
+        if len(recovering):
+            self.stale[recovering] = False
+            self.counters["recovered"] += len(recovering)
+            if self.alert is not None:
+                for slot, seconds in zip(recovering.tolist(), silent.tolist()):
+                    self.alert(slot, "recovered", seconds)
+
+    def _check(self, slot):
+        silent = self.timers.clock() - self.last_seen[slot]
+        if silent < self.after:
+            self.timers.schedule(self.after - silent, self._check, slot)
+            return
+
+        self.armed[slot] = False
+        self.stale[slot] = True
+        self.counters["alerts"] += 1
+        if self.alert is not None:
+            self.alert(slot, "stale", float(silent))
+
+    def stats(self):
+        return dict(self.counters, watched=int(np.count_nonzero(self.armed)), stale=len(self))
@@ -42,7 +42,8 @@ class Pitcher(IHandler):
             while self._check_living():
                 try:
                     data = data_queue.get(timeout=1)
-                    await self.publish(data)
+                    for payload in self.records(data):
+                        await self.publish(payload)
                     await asyncio.sleep(self.throttle_delay)
                 except queue.Empty:
                     await asyncio.sleep(0.05)
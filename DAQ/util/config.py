@@ -13,6 +13,7 @@ def load_config():
             "command_topic": os.getenv("COMMAND_TOPIC", "daq.command"),
             "response_topic": os.getenv("RESPONSE_TOPIC", "daq.response"),
             "emulator_topic": os.getenv("EMULATOR_TOPIC", "daq.emulator"),
+            "latest_topic": os.getenv("LATEST_TOPIC", "daq.latest"),
         },
         "database": {
             "redis": {
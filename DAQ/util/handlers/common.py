@@ -9,6 +9,7 @@ import time
 import uuid
 from multiprocessing import util
 from multiprocessing.managers import SyncManager
+from DAQ.commands.samples import SampleBatch
 from DAQ.util.hex import _h
 from DAQ.util.logger import make_logger
 from DAQ.util.utctime import utcepochnow
@@ -90,6 +91,30 @@ class HandlerManager:
                 if proc.is_alive():
                     os.kill(proc.pid, signal.SIGKILL)
 
+# ---------------------
+# RecordBatch
+# ---------------------
+
+class RecordBatch(list):
+    """
+    Many records handed over a handler queue in one put, so a batch costs
+    one pickle and one feeder-thread wakeup instead of one per record.
+    A list subclass rather than a plain list, which some queues already
+    carry as a single record.
+    """
+
+
+def handoff(batch, min_samples=32):
+    """
+    The queue item for a SampleBatch: the batch itself, or its records when
+    it holds fewer than ``min_samples`` samples. Below that, pickling the
+    columns costs more than the record dicts do.
+    """
+    if len(batch) >= min_samples:
+        return batch
+    records = batch.payloads()
+    return records[0] if len(records) == 1 else RecordBatch(records)
+
 # ---------------------
 # IHandler
 # ---------------------
@@ -177,6 +202,18 @@ class IHandler:
             dead.extend(h.get_dead_handlers())
         return dead
 
+    @staticmethod
+    def records(payload):
+        """
+        The records in one queue item: the per-sample payloads of a
+        SampleBatch, the items of a RecordBatch, or the item itself.
+        """
+        if isinstance(payload, SampleBatch):
+            return payload.payloads()
+        if isinstance(payload, RecordBatch):
+            return payload
+        return (payload,)
+
     def loop(self, *_):
         self.set('heartbeat', utcepochnow())
 
@@ -253,11 +290,14 @@ class BSONHandler(IHandler):
         while self._check_living():
             try:
                 payload = data_queue.get(timeout=1)
-                if not isinstance(payload, dict):
-                    self.logger.warning(f"[BSON] Skipping non-dict payload: {type(payload)}")
-                    continue
-                encoded = self.encode(payload)
-                processed_queue.put(encoded)
+                encoded = RecordBatch()
+                for record in self.records(payload):
+                    if not isinstance(record, dict):
+                        self.logger.warning(f"[BSON] Skipping non-dict payload: {type(record)}")
+                        continue
+                    encoded.append(self.encode(record))
+                if encoded:
+                    processed_queue.put(encoded)
             except queue.Empty:
                 time.sleep(0.1)
 
@@ -282,7 +322,7 @@ class CompressionHandler(IHandler):
         while self._check_living():
             try:
                 data = data_queue.get(timeout=5)
-                cache['cache'].append(data)
+                cache['cache'].extend(self.records(data))
             except queue.Empty:
                 pass
 
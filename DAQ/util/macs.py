@@ -0,0 +1,103 @@
+"""
+Process-wide MAC registry.
+
+Every 8-byte node address is interned to a small integer slot the first time
+it is seen. Slots are what in-memory tables (routes, reassembly sets, dedupe
+counters, SampleBatch.mac) key and index by; the hex text form is rendered
+once per slot, when something leaves the process (responses, stats, BSON).
+
+Addresses are interned in wire order, exactly as the 8 bytes sit in the mesh
+header (least significant byte first), so decoding a header costs a single
+dict lookup. Slots are local to a process: anything pickled to another
+process carries the wire bytes and is re-interned on arrival.
+
+Slots are never reused, and the tables indexed by them grow with the
+registry. ``daq.mac_capacity`` bounds it: once that many addresses are
+interned, new ones (on a noisy link without ``gateway.frame_crc``, mostly
+corrupted headers) get UNKNOWN instead of a slot, and are counted in
+``overflow``.
+"""
+
+import binascii
+from DAQ.util.config import load_config
+from DAQ.util.hex import _h
+from DAQ.util.logger import make_logger
+
+logger = make_logger("macs")
+cfg = load_config()
+
+WIRE_LEN = 8
+
+#: slot for commands that have no header to take an address from
+UNKNOWN = -1
+UNKNOWN_TEXT = "unknown"
+
+
+class MacRegistry:
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.slots = {}   # wire bytes -> slot
+        self.wire = []    # slot -> wire bytes
+        self.texts = []   # slot -> hex text, rendered on first use
+        self.overflow = 0
+
+    def __len__(self):
+        return len(self.wire)
+
+    def intern(self, wire):
+        """The slot for an address in wire order (8 bytes, LSB first); UNKNOWN once the registry is full."""
+        slot = self.slots.get(wire)
+        if slot is None:
+            if len(wire) != WIRE_LEN:
+                raise ValueError(f"MAC address must be {WIRE_LEN} bytes, got {len(wire)}")
+            if len(self.wire) >= self.capacity:
+                if not self.overflow:
+                    logger.warning(f"[MACS] Registry full ({self.capacity} addresses); new ones are UNKNOWN")
+                self.overflow += 1
+                return UNKNOWN
+            wire = bytes(wire)
+            slot = self.slots[wire] = len(self.wire)
+            self.wire.append(wire)
+            self.texts.append(None)
+        return slot
+
+    def lookup(self, wire):
+        """The slot of an address in wire order already interned, else UNKNOWN; never interns."""
+        return self.slots.get(wire, UNKNOWN)
+
+    @staticmethod
+    def to_wire(mac):
+        """Wire order bytes for a MAC in any textual form (at most 16 hex digits, zero-filled)."""
+        text = mac.decode() if isinstance(mac, (bytes, bytearray)) else str(mac)
+        text = text.replace(":", "").strip()
+        if len(text) > 2 * WIRE_LEN:
+            raise ValueError(f"MAC address longer than {WIRE_LEN} bytes: {text!r}")
+        return binascii.unhexlify(text.zfill(2 * WIRE_LEN))[::-1]
+
+    def slot(self, mac):
+        """The slot for a MAC in any textual form: hex str or bytes, any case, ``:`` separators allowed."""
+        if isinstance(mac, int):
+            return mac
+        return self.intern(self.to_wire(mac))
+
+    def find(self, mac):
+        """Like slot(), but None for an address never seen instead of interning it."""
+        if isinstance(mac, int):
+            return mac if 0 <= mac < len(self.wire) else None
+        try:
+            return self.slots.get(self.to_wire(mac))
+        except (ValueError, binascii.Error):
+            return None
+
+    def text(self, slot):
+        """Uppercase hex bytes, most significant byte first (the form Message.addr has always had)."""
+        if slot < 0:
+            return UNKNOWN_TEXT
+        text = self.texts[slot]
+        if text is None:
+            text = self.texts[slot] = _h(self.wire[slot][::-1])
+        return text
+
+
+MACS = MacRegistry(cfg.get("daq", {}).get("mac_capacity", 65536))
+BROADCAST = MACS.intern(b"\xff" * 8)
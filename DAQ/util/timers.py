@@ -0,0 +1,146 @@
+"""
+Hierarchical timer wheel for large numbers of coarse timeouts (command
+request TTLs, reassembly deadlines, route expiry, device staleness, ...).
+Scheduling and cancelling are O(1), and nothing ever scans the full set of
+pending timeouts.
+
+Level 0 has one slot per tick. Each slot of level ``n`` spans ``slots ** n``
+ticks. A timer goes into the finest level whose range covers its deadline.
+When the clock enters a coarse slot's span, the slot is cascaded: each of its
+timers moves down to a finer level. A timer is therefore touched at most
+once per level before it fires, however far out it was scheduled. With the
+defaults (1 s ticks, 512 slots, 4 levels) the wheel covers over two thousand
+years. Timers beyond the top level's range wait in its slots and are
+re-placed each time their slot is cascaded.
+
+With ``levels=1`` this is a plain hashed wheel: timers further out than one
+rotation (``tick * slots`` seconds) are revisited once per rotation.
+"""
+
+import asyncio
+import math
+import time
+from DAQ.util.logger import make_logger
+
+logger = make_logger("timers")
+
+
+class Timer:
+    __slots__ = ("deadline", "expires", "callback", "args", "cancelled", "wheel")
+
+    def __init__(self, deadline, expires, callback, args, wheel):
+        self.deadline = deadline
+        self.expires = expires  # tick it fires on
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.wheel = wheel      # None once fired or cancelled
+
+    def cancel(self):
+        self.cancelled = True
+        if self.wheel is not None:
+            self.wheel.live -= 1
+            self.wheel = None
+
+
+class TimerWheel:
+    def __init__(self, tick=1.0, slots=512, levels=4, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.size = slots
+        self.levels = [[[] for _ in range(slots)] for _ in range(max(levels, 1))]
+        self.spans = [slots ** level for level in range(len(self.levels) + 1)]  # ticks per slot
+        self.current = int(clock() / tick)  # last tick processed
+        self.live = 0
+        self.fired = 0
+        self.cascaded = 0
+        self._handle = None
+
+    def schedule(self, delay, callback, *args):
+        """Call ``callback(*args)`` once ``delay`` seconds have passed (at tick resolution)."""
+        deadline = self.clock() + delay
+        timer = Timer(deadline, max(math.ceil(deadline / self.tick), self.current + 1), callback, args, self)
+        self._insert(timer)
+        self.live += 1
+        return timer
+
+    def _insert(self, timer):
+        delta, spans = timer.expires - self.current, self.spans
+        level, top = 0, len(self.levels) - 1
+        while level < top and delta >= spans[level + 1]:
+            level += 1
+        self.levels[level][(timer.expires // spans[level]) % self.size].append(timer)
+
+    def _cascade(self, tick):
+        # coarsest first, so a timer can fall through several levels in one tick
+        for level in range(len(self.levels) - 1, 0, -1):
+            span = self.spans[level]
+            if tick % span:
+                continue
+            wheel, index = self.levels[level], (tick // span) % self.size
+            slot, wheel[index] = wheel[index], []
+            for timer in slot:
+                if not timer.cancelled:
+                    self._insert(timer)
+                    self.cascaded += 1
+
+    def advance(self, now=None):
+        """Fire every timer due by ``now``; returns how many fired."""
+        now = self.clock() if now is None else now
+        target = int(now / self.tick)
+        if not self.live and target - self.current > self.size:
+            # nothing pending: skip the idle ticks rather than walk them
+            for wheel in self.levels:
+                for slot in wheel:
+                    slot.clear()
+            self.current = target
+            return 0
+
+        fired = 0
+        wheel = self.levels[0]
+        while self.current < target:
+            self.current = tick = self.current + 1
+            if len(self.levels) > 1 and not tick % self.size:
+                self._cascade(tick)
+
+            index = tick % self.size
+            slot, wheel[index] = wheel[index], []
+            for timer in slot:
+                if timer.cancelled:
+                    continue
+                if timer.expires > tick:
+                    # beyond the top level's range: not due this rotation
+                    self._insert(timer)
+                    continue
+                timer.wheel = None
+                self.live -= 1
+                fired += 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    # the wheel is shared: one failing timeout must not drop the rest of its slot
+                    logger.exception(f"[TIMER] {getattr(timer.callback, '__qualname__', timer.callback)} failed")
+
+        self.fired += fired
+        return fired
+
+    def __len__(self):
+        """Timers scheduled and neither fired nor cancelled."""
+        return self.live
+
+    def stats(self):
+        return dict(pending=self.live, fired=self.fired, cascaded=self.cascaded)
+
+    def start(self):
+        """Drive the wheel from the running event loop."""
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.tick, self._on_tick)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _on_tick(self):
+        self._handle = asyncio.get_running_loop().call_later(self.tick, self._on_tick)
+        self.advance()
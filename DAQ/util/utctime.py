@@ -2,6 +2,7 @@
 import calendar
 import datetime
 
+import numpy as np
 import pytz
 from numpy.compat import unicode
 
@@ -123,6 +124,72 @@ def day_duration(date, lat, long):
 
     return (setting.datetime() - rising.datetime())
 
+class SunriseAnchor(object):
+    """
+    Epoch of the sunrise that panels count their 16-bit sample timestamps
+    from: the latest sunrise at or before now, at the site's latitude and
+    longitude (strings, as for :func:`sunrise`).
+
+    The anchor is worked out once per day and moves on to the next sunrise
+    when it passes. :meth:`resolve` turns whole arrays of counters into UTC
+    epochs. Samples counted from the previous sunrise and counters that have
+    wrapped past 0xFFFF are handled there.
+    """
+
+    #: the counter wraps after this many seconds (a little over 18 hours)
+    WRAP = 0x10000
+    DAY = 86400.0
+
+    def __init__(self, lat, long, skew=300.0, fallback=datetime.time(6, 0)):
+        self.lat = lat
+        self.long = long
+        #: how far in the future a sample may land before it is taken to
+        #: belong to the previous sunrise (node clock drift)
+        self.skew = skew
+        self.fallback = fallback
+        self.current = self.previous = self.next = None
+
+    def _rising(self, day):
+        try:
+            return datetime_to_epoch(sunrise(day.strftime('%Y/%m/%d'), self.lat, self.long))
+        except Exception:
+            # no ephem, or no sunrise that day (polar day / night)
+            return datetime_to_epoch(datetime.datetime.combine(day, self.fallback))
+
+    def update(self, now):
+        """The anchor for ``now`` (a UTC epoch), recomputed only when a sunrise has passed."""
+        if self.next is None or not self.current <= now < self.next:
+            day = epoch_to_datetime(now).date()
+            rising = self._rising(day)
+            if rising > now:
+                day -= datetime.timedelta(days=1)
+                rising = self._rising(day)
+            self.current = rising
+            self.previous = self._rising(day - datetime.timedelta(days=1))
+            self.next = self._rising(day + datetime.timedelta(days=1))
+        return self.current
+
+    def resolve(self, seconds, now):
+        """
+        UTC epochs (float64) for an array of seconds-since-sunrise counters
+        received at ``now``.
+
+        A counter that would put its sample in the future was counted from
+        the previous sunrise. Each counter is then moved forward by whole
+        wraps to its latest time that is not in the future.
+        """
+        anchor = self.update(now)
+        seconds = np.asarray(seconds, dtype=np.float64)
+        limit = now + self.skew
+        epochs = anchor + seconds
+        epochs = np.where(epochs > limit, self.previous + seconds, epochs)
+        wraps = np.floor((limit - epochs) / self.WRAP)
+        return epochs + np.maximum(wraps, 0) * self.WRAP
+
+    def seconds(self, epoch):
+        """The counter value a node would report for ``epoch``, saturating at 0xFFFE."""
+        return min(max(int(epoch - self.update(epoch)), 0), 0xFFFE)
+
 def utcnow():
     """:return: ``datetime.datetime`` object in UTC"""
     return datetime.datetime.now(pytz.utc)
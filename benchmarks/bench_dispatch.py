@@ -0,0 +1,85 @@
+"""
+Command dispatch over mixed command streams, hex-string lookup vs the
+integer-indexed COMMAND_TABLE.
+
+before: every command byte is formatted with ``.hex().upper()`` and looked
+        up in the ``command_mapper`` dict (reproduced in legacy_parse).
+after:  Message.parse_payload indexes COMMAND_TABLE with the command byte.
+
+Each payload mixes DataIndications with commands of unregistered types,
+which both paths decode as RawResponse.
+"""
+
+import argparse
+import random
+
+from DAQ.commands.protocol import Message, DataIndication, RawResponse, command_mapper
+from benchmarks.common import quiet, report, timed
+
+
+def make_streams(count, commands, seed=7):
+    """``count`` command streams of ``commands`` commands each, one in three a DataIndication."""
+    rnd = random.Random(seed)
+    streams = []
+    for _ in range(count):
+        stream = bytearray()
+        for _ in range(commands):
+            if rnd.random() < 1 / 3:
+                body = bytes([0xDD]) + bytes(4) + bytes(rnd.getrandbits(8) for _ in range(14 * rnd.randint(1, 3)))
+            else:
+                body = bytes([rnd.choice((0x01, 0x10, 0x42, 0xA0))]) + bytes(rnd.randint(0, 12))
+            stream += bytes([len(body)]) + body
+        streams.append(bytes(stream))
+    return streams
+
+
+def legacy_parse(msg, payload):
+    commands = []
+    i = 0
+    while i < len(payload):
+        cmd_len = payload[i]
+        cmd_data = payload[i + 1: i + 1 + cmd_len]
+        cmd_class = command_mapper.get(cmd_data[0:1].hex().upper(), RawResponse)
+        cmd_instance = cmd_class(header=msg, raw=cmd_data[1:])
+        cmd_instance.parse(cmd_data[1:])
+        commands.append(cmd_instance)
+        i += 1 + cmd_len
+    return commands
+
+
+def run_legacy(msg, streams):
+    for payload in streams:
+        legacy_parse(msg, payload)
+
+
+def run_table(msg, streams):
+    for payload in streams:
+        msg.parse_payload(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20000)
+    parser.add_argument("--commands", type=int, default=6, help="commands per stream")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    streams = make_streams(args.streams, args.commands)
+    msg = Message()
+
+    msg.parse_payload(streams[0])
+    assert [type(c) for c in msg.commands] == [type(c) for c in legacy_parse(msg, streams[0])]
+    assert any(isinstance(c, DataIndication) for s in streams[:10] for c in legacy_parse(msg, s))
+
+    with quiet():
+        t_before = timed(run_legacy, msg, streams, repeat=args.repeat)
+        t_after = timed(run_table, msg, streams, repeat=args.repeat)
+
+    count = args.streams * args.commands
+    r_before = report("hex().upper() + command_mapper", count, t_before, "cmds")
+    r_after = report("COMMAND_TABLE[byte]", count, t_after, "cmds")
+    print(f"speedup: {r_after / r_before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
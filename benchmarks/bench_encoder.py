@@ -0,0 +1,63 @@
+"""
+DataIndication frame encode throughput, per-frame objects vs FrameEncoder.
+
+before: the emulator path; a Message and DataIndication per frame,
+        Message.decompile() and mi_frame() around it.
+after:  FrameEncoder.encode_data() packs every frame of the batch into one
+        reusable buffer with pack_into and returns a single MI stream.
+"""
+
+import argparse
+import random
+
+from DAQ.commands.protocol import Message, DataIndication
+from DAQ.gateway.encoder import FrameEncoder
+from DAQ.gateway.framing import mi_frame
+from benchmarks.common import panel_macs, quiet, report, timed
+
+
+def make_readings(n_panels, samples, seed=7):
+    rnd = random.Random(seed)
+    readings = []
+    for mac in panel_macs(n_panels, seed):
+        Vi, Ii = round(rnd.uniform(38.0, 40.0), 2), round(rnd.uniform(7.0, 8.0), 2)
+        readings.append((mac, [(i, Vi, Vi, Ii, Ii, round(Vi * Ii, 2), round(Vi * Ii, 2)) for i in range(samples)]))
+    return readings
+
+
+def encode_objects(readings):
+    frames = []
+    for mac, samples in readings:
+        msg = Message()
+        msg.set_addr(mac)
+        msg.dtype = Message.TYPE_PLM
+        cmd = DataIndication()
+        for sample in samples:
+            cmd.add_data(*sample)
+        msg.add_command(cmd)
+        frames.append(mi_frame(msg.decompile()))
+    return b"".join(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=1, help="samples per DataIndication")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    readings = make_readings(args.panels, args.samples)
+    encoder = FrameEncoder()
+
+    with quiet():
+        assert encode_objects(readings) == encoder.encode_data(readings, dtype=Message.TYPE_PLM)
+        t_before = timed(encode_objects, readings, repeat=args.repeat)
+    t_after = timed(lambda: encoder.encode_data(readings, dtype=Message.TYPE_PLM), repeat=args.repeat)
+
+    r_before = report("Message.decompile + mi_frame", len(readings), t_before)
+    r_after = report("FrameEncoder.encode_data", len(readings), t_after)
+    print(f"speedup: {r_after / r_before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
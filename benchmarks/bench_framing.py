@@ -0,0 +1,72 @@
+"""
+Gateway TCP framing throughput over loopback: StreamReader handler
+(three readexactly calls per frame) vs the MIFrameProtocol BufferedProtocol.
+"""
+
+import argparse
+import asyncio
+import time
+
+from DAQ.gateway.server import handle_tcp_connection
+from DAQ.gateway.framing import MIFrameProtocol
+from DAQ.gateway.ingest import IngestQueue
+from DAQ.gateway.dedupe import DEDUPE
+from benchmarks.common import make_panel_frames, number_frames, mi_stream, quiet, report
+
+
+async def start_stream(queue):
+    return await asyncio.start_server(lambda r, w: handle_tcp_connection(r, w, queue), "127.0.0.1", 0)
+
+
+async def start_buffered(queue):
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(lambda: MIFrameProtocol(queue), "127.0.0.1", 0)
+
+
+async def run(start, stream, count, chunk):
+    queue = IngestQueue()
+    if DEDUPE is not None:
+        DEDUPE.clear()  # both runs replay the same stream
+    server = await start(queue)
+    port = server.sockets[0].getsockname()[1]
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    begin = time.perf_counter()
+    for i in range(0, len(stream), chunk):
+        writer.write(stream[i:i + chunk])
+        await writer.drain()
+
+    received = 0
+    while received < count:
+        received += len(await asyncio.wait_for(queue.get_batch(), timeout=10))
+    elapsed = time.perf_counter() - begin
+
+    writer.close()
+    await writer.wait_closed()
+    await asyncio.sleep(0.05)  # let the server side see EOF
+    server.close()
+    await server.wait_closed()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--panels", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=4, help="frames per panel")
+    parser.add_argument("--chunk", type=int, default=16384, help="client write size")
+    args = parser.parse_args()
+
+    payloads = number_frames(make_panel_frames(args.panels) * args.rounds)
+    stream = mi_stream(payloads)
+
+    with quiet():
+        t_stream = asyncio.run(run(start_stream, stream, len(payloads), args.chunk))
+        t_buffered = asyncio.run(run(start_buffered, stream, len(payloads), args.chunk))
+
+    r_stream = report("stream (readexactly)", len(payloads), t_stream)
+    r_buffered = report("buffered (MIFrameProtocol)", len(payloads), t_buffered)
+    print(f"speedup: {r_buffered / r_stream:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
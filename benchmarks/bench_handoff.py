@@ -0,0 +1,102 @@
+"""
+Records/s from the DAQ core to a handler process over multiprocessing.Queue.
+
+per record:  one put per record dict (batch size 1 is how every sample
+             used to be handed over)
+RecordBatch: one put per ``--sizes`` records
+SampleBatch: one put per batch of that many samples, as DAQProcess.emit
+             hands it over: through handoff(), so batches under
+             ``--min-samples`` go as record dicts and larger ones as
+             columns the consumer expands, as BSONHandler does
+
+Records are built before the clock starts on every path. The core has to
+build them either way below ``--min-samples``, and the old per-record path
+built them too, so the rates compare only the handoff.
+
+The consumer walks every record with IHandler.records, so the rates cover
+pickling, the feeder thread, the pipe and unpickling on the far side. The
+run fails if the SampleBatch handoff is slower than one put per record at
+any size below ``--min-samples``.
+"""
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from DAQ.commands.samples import SampleBatch, SCALED_FIELDS
+from DAQ.util.handlers.common import IHandler, RecordBatch, handoff
+from DAQ.util.macs import MACS
+from benchmarks.common import panel_macs, report
+
+SIZES = (1, 10, 100, 1000)
+
+
+def make_batch(n, seed=7):
+    rnd = np.random.default_rng(seed)
+    macs = [MACS.slot(mac) for mac in panel_macs(64, seed)]
+    values = {name: np.round(rnd.uniform(0, 400, n), 2) for name in SCALED_FIELDS}
+    batch = SampleBatch(np.asarray(macs, dtype=np.intp)[rnd.integers(0, len(macs), n)],
+                        rnd.integers(0, 0xFFFE, n), values,
+                        np.zeros(n, dtype=np.uint16), np.zeros(n, dtype=np.uint16))
+    batch.freezetime = 1.7e9 + batch.timestamp.astype(np.float64)
+    batch.localtime = time.time()
+    return batch
+
+
+def consume(data_queue, done):
+    count = 0
+    while True:
+        payload = data_queue.get()
+        if payload is None:
+            break
+        for _ in IHandler.records(payload):
+            count += 1
+    done.put(count)
+
+
+def run(items, expected):
+    data_queue, done = multiprocessing.Queue(), multiprocessing.Queue()
+    proc = multiprocessing.Process(target=consume, args=(data_queue, done))
+    proc.start()
+    start = time.perf_counter()
+    for item in items:
+        data_queue.put(item)
+    data_queue.put(None)
+    count = done.get()
+    elapsed = time.perf_counter() - start
+    proc.join()
+    assert count == expected, (count, expected)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="records per put")
+    parser.add_argument("--min-samples", type=int, default=32, help="handoff() threshold (daq.handoff_min_samples)")
+    parser.add_argument("--tolerance", type=float, default=0.9,
+                        help="slowest SampleBatch rate below --min-samples, as a fraction of per record")
+    args = parser.parse_args()
+
+    n = args.records
+    batch = make_batch(n)
+    rows = batch.payloads()
+
+    t_single = run(rows, n)
+    r_single = report("per record", n, t_single, "records")
+    for size in args.sizes:
+        starts = range(0, n, size)
+        t_records = run([RecordBatch(rows[i:i + size]) for i in starts], n)
+        t_columns = run([handoff(batch.take(slice(i, i + size)), args.min_samples) for i in starts], n)
+        r_records = report(f"RecordBatch x{size}", n, t_records, "records")
+        r_columns = report(f"SampleBatch x{size}", n, t_columns, "records")
+        print(f"{'':<40} speedup: {r_records / r_single:.2f}x (records), {r_columns / r_single:.2f}x (columns)")
+        if size < args.min_samples:
+            assert r_columns >= args.tolerance * r_single, \
+                f"SampleBatch x{size} handoff is {r_columns / r_single:.2f}x one put per record"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Mesh header decode speed and memory per message, before and after the
+single-unpack decoder.
+
+before: the header is sliced into nine tokens, MeshCtrl computes its seven
+        flags eagerly and both objects carry a ``__dict__`` (reproduced here
+        as LegacyMessage / LegacyMeshCtrl).
+after:  Message.from_raw unpacks the 17 header bytes with one precompiled
+        struct, MeshCtrl keeps only the control byte and both use __slots__.
+
+Memory is measured with tracemalloc as the bytes still allocated while all
+decoded messages are held, divided by the message count.
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from DAQ.commands.protocol import Message
+from DAQ.util.hex import _h
+from benchmarks.common import make_panel_frames, quiet, report, timed
+
+
+class LegacyMeshCtrl:
+    def __init__(self, ctrl=0):
+        self.ctrl = ctrl
+        self.atype = bool(ctrl & 0x80)
+        self.super = bool(ctrl & 0x40)
+        self.rreq = bool(ctrl & 0x20)
+        self.fail = bool(ctrl & 0x10)
+        self.prior = bool(ctrl & 0x08)
+        self.tbd1 = bool(ctrl & 0x04)
+        self.version = ctrl & 0x03
+
+
+class LegacyMessage:
+    def __init__(self):
+        self.mesh_ctrl = LegacyMeshCtrl()
+        self.addr = 'FF' * 8
+        self.request_id = 0
+        self.source_hopcount = 0
+        self.source_queue_length = 0
+        self.hopcount = 0
+        self.queue_length = 0
+        self._reserved = 0
+        self.dtype = 0
+        self.partnum = 1
+        self.numparts = 1
+        self.payload = b""
+        self.commands = []
+        self.raw = b""
+        self.received_on = None
+
+    @staticmethod
+    def from_raw(message_type, length, raw, received_on):
+        msg = LegacyMessage()
+        msg.raw = raw
+        msg.received_on = received_on
+
+        tokens, payload = Message.tokenize_string(raw, Message.LEN_ORDER)
+
+        msg.mesh_ctrl = LegacyMeshCtrl(tokens[0][0])
+        msg.addr = _h(bytes(tokens[1])[::-1])
+        msg.request_id = int.from_bytes(tokens[2], 'big')
+        msg.source_hopcount = tokens[3][0]
+        msg.source_queue_length = tokens[4][0]
+        msg.hopcount = tokens[5][0]
+        msg.queue_length = tokens[6][0]
+        dt = tokens[7][0]
+        msg._reserved = dt >> 4
+        msg.dtype = dt & 0x0F
+        parts = tokens[8][0]
+        msg.partnum = (parts >> 4) + 1
+        msg.numparts = (parts & 0x0F) + 1
+        msg.payload = payload
+        return msg
+
+
+def decode_all(decoder, frames):
+    return [decoder(Message.MESH_INDICATION, len(raw), raw, 0.0) for raw in frames]
+
+
+def bytes_per_message(decoder, frames):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = decode_all(decoder, frames)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del messages
+    return held / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # header-only frames isolate the header path from command parsing
+    headers = [raw[:Message.HEADER_LEN] for raw in make_panel_frames(args.panels)]
+
+    with quiet():
+        t_before = timed(decode_all, LegacyMessage.from_raw, headers, repeat=args.repeat)
+        t_after = timed(decode_all, Message.from_raw, headers, repeat=args.repeat)
+        m_before = bytes_per_message(LegacyMessage.from_raw, headers)
+        m_after = bytes_per_message(Message.from_raw, headers)
+
+    r_before = report("tokenize + __dict__", len(headers), t_before, "headers")
+    r_after = report("struct.unpack_from + __slots__", len(headers), t_after, "headers")
+    print(f"speedup: {r_after / r_before:.2f}x")
+    print(f"memory per message: {m_before:.0f} B -> {m_after:.0f} B ({m_before / m_after:.2f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
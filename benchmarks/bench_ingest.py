@@ -0,0 +1,60 @@
+"""
+Gateway → DAQProcess ingest throughput, before and after the parse-once envelope.
+
+before: the gateway parses each frame to validate it, enqueues the raw tuple,
+        and DAQProcess parses the same bytes again before dispatch.
+after:  the gateway enqueues an IngestEnvelope carrying the decoded Message and
+        DAQProcess dispatches straight from it.
+"""
+
+import argparse
+import asyncio
+
+from DAQ.commands.protocol import Message
+from DAQ.gateway.ingest import IngestEnvelope
+from benchmarks.common import make_panel_frames, quiet, report, timed
+
+
+def dispatch(commands):
+    for command in commands:
+        command.response()
+
+
+async def before(payloads):
+    queue = asyncio.Queue()
+    for raw in payloads:
+        Message.from_raw(Message.MESH_INDICATION, len(raw), raw, 0.0)
+        queue.put_nowait(("bench", Message.MESH_INDICATION, len(raw), raw, 0.0))
+        gwid, msg_type, length, raw, received_on = await queue.get()
+        msg = Message.from_raw(msg_type, length, raw, received_on)
+        dispatch(msg.commands)
+
+
+async def after(payloads):
+    queue = asyncio.Queue()
+    for raw in payloads:
+        queue.put_nowait(IngestEnvelope.decode("bench", Message.MESH_INDICATION, len(raw), raw, 0.0))
+        envelope = await queue.get()
+        dispatch(envelope.commands)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=1, help="samples per DataIndication")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    payloads = make_panel_frames(args.panels, args.samples)
+
+    with quiet():
+        t_before = timed(lambda: asyncio.run(before(payloads)), repeat=args.repeat)
+        t_after = timed(lambda: asyncio.run(after(payloads)), repeat=args.repeat)
+
+    r_before = report("parse twice (raw tuple)", len(payloads), t_before)
+    r_after = report("parse once (IngestEnvelope)", len(payloads), t_after)
+    print(f"speedup: {r_after / r_before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Gateway-side decode cost of whole frames, eager vs header-only.
+
+eager: Message.from_raw walks the payload and builds every command.
+lazy:  Message.from_raw(..., lazy=True) decodes the 17-byte header only;
+       commands are parsed when first read, which a frame that is only
+       deduplicated, routed or counted never does.
+
+Also reports the pickled size of a decoded message, which is what an
+acceptor process ships to the DAQ core per frame.
+"""
+
+import argparse
+import pickle
+
+from DAQ.commands.protocol import Message
+from benchmarks.common import make_panel_frames, quiet, report, timed
+
+
+def decode_all(frames, lazy):
+    return [Message.from_raw(Message.MESH_INDICATION, len(raw), raw, 0.0, lazy=lazy) for raw in frames]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=4, help="samples per DataIndication")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    frames = make_panel_frames(args.panels, args.samples)
+
+    with quiet():
+        t_eager = timed(decode_all, frames, False, repeat=args.repeat)
+        t_lazy = timed(decode_all, frames, True, repeat=args.repeat)
+        eager = Message.from_raw(Message.MESH_INDICATION, len(frames[0]), frames[0], 0.0)
+    lazy = Message.from_raw(Message.MESH_INDICATION, len(frames[0]), frames[0], 0.0, lazy=True)
+
+    r_eager = report("from_raw (commands parsed)", len(frames), t_eager)
+    r_lazy = report("from_raw lazy (header only)", len(frames), t_lazy)
+    print(f"speedup: {r_lazy / r_eager:.2f}x")
+    print(f"pickled message: {len(pickle.dumps(eager))} B -> {len(pickle.dumps(lazy))} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Offline throughput, allocation and fuzz suite for DAQ/commands/protocol.py.
+
+Throughput mode (default) runs every stage over each payload mix and
+reports frames/s and the bytes allocated per frame (tracemalloc peak):
+
+  from_raw         Message.from_raw, commands parsed
+  from_raw lazy    Message.from_raw(..., lazy=True), header only
+  samples          DataIndication.parse and its SampleBatch decode
+  round trip       from_raw followed by Message.decompile
+  framing          MIFrameProtocol.buffer_updated over an MI stream
+
+Mixes: ``single`` (one sample per frame), ``multi`` (8), ``full`` (as many
+as fit in a frame) and ``mixed`` (a DataIndication plus commands of
+unregistered types, which decode as RawResponse).
+
+``--fuzz`` instead runs randomised property checks, reproducible with
+``--seed``:
+
+  round trip   random DataIndication frames survive encode -> frame ->
+               decode -> decompile byte for byte, and decode to the values
+               they were encoded from
+  malformed    truncated, bit-flipped, junk-padded and random inputs never
+               raise out of the framing loop or Message.from_raw other than
+               with ValueError / struct.error
+  linear       adversarial inputs of growing size cost time proportional
+               to their size: the log-log slope of time against size,
+               fitted over five sizes, stays under 1.3 (quadratic is 2)
+"""
+
+import argparse
+import gc
+import math
+import random
+import statistics
+import struct
+import sys
+import time
+import tracemalloc
+
+from DAQ.commands.protocol import Message, DataIndication
+from DAQ.gateway.encoder import FrameEncoder, MAX_SAMPLES
+from DAQ.gateway.framing import MIFrameProtocol, MI_HEADER
+from DAQ.gateway.dedupe import DEDUPE
+from benchmarks.common import make_panel_frames, number_frames, mi_stream, quiet, report, timed
+
+MIXES = {"single": 1, "multi": 8, "full": MAX_SAMPLES, "mixed": 1}
+UNREGISTERED = (0x01, 0x10, 0x42, 0xA0)
+
+
+class Sink:
+    """Stands in for recv_queue: keeps what the framing loop offers."""
+
+    def __init__(self):
+        self.frames = 0
+
+    def offer(self, batch):
+        self.frames += len(batch)
+        return True
+
+
+def make_mix(name, n_panels, seed=7):
+    if name != "mixed":
+        return make_panel_frames(n_panels, MIXES[name], seed)
+
+    rnd = random.Random(seed)
+    frames = []
+    for payload in make_panel_frames(n_panels, 1, seed):
+        extra = bytearray()
+        for _ in range(rnd.randint(1, 4)):
+            body = bytes([rnd.choice(UNREGISTERED)]) + bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 12)))
+            extra += bytes([len(body)]) + body
+        frames.append(payload + bytes(extra))
+    return frames
+
+
+def decode(frames, lazy=False):
+    return [Message.from_raw(Message.MESH_INDICATION, len(raw), raw, 0.0, lazy=lazy) for raw in frames]
+
+
+def decode_samples(commands):
+    for cmd in commands:
+        cmd.parse(cmd.raw)
+        cmd.samples
+
+
+def round_trip(frames):
+    return [Message.from_raw(Message.MESH_INDICATION, len(raw), raw, 0.0).decompile() for raw in frames]
+
+
+def feed(stream, chunk=16384, check_crc=False):
+    """Run an MI stream through MIFrameProtocol in ``chunk``-sized reads; returns the frames offered."""
+    if DEDUPE is not None:
+        DEDUPE.clear()
+    sink = Sink()
+    proto = MIFrameProtocol(sink, gwid="bench", check_crc=check_crc)
+    pos = 0
+    while pos < len(stream):
+        # like the event loop, read no more than the buffer handed out
+        buf = proto.get_buffer(chunk)
+        n = min(len(buf), chunk, len(stream) - pos)
+        buf[:n] = stream[pos:pos + n]
+        proto.buffer_updated(n)
+        pos += n
+    return sink.frames
+
+
+def allocated(fn, *args):
+    """Peak bytes allocated while running ``fn(*args)``."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def throughput(args):
+    for name in args.mixes:
+        frames = number_frames(make_mix(name, args.panels))
+        stream = mi_stream(frames)
+        with quiet():
+            commands = [c for m in decode(frames) for c in m.commands if isinstance(c, DataIndication)]
+        print(f"-- {name}: {len(frames)} frames, {len(stream) / len(frames):.0f} B/frame")
+
+        stages = (("from_raw", decode, (frames,)),
+                  ("from_raw lazy", decode, (frames, True)),
+                  ("samples", decode_samples, (commands,)),
+                  ("round trip", round_trip, (frames,)),
+                  ("framing", feed, (stream,)))
+        for label, fn, fn_args in stages:
+            with quiet():
+                seconds = timed(fn, *fn_args, repeat=args.repeat)
+                peak = allocated(fn, *fn_args)
+            report(label, len(frames), seconds)
+            print(f"{'':<40} {peak / len(frames):>8.0f} B/frame allocated")
+
+
+class Failure(Exception):
+    pass
+
+
+def random_readings(rnd, count):
+    readings = []
+    for _ in range(count):
+        samples = [(rnd.randrange(0, 0x10000),) + tuple(rnd.randint(-32768, 32767) / 100 for _ in range(6))
+                   for _ in range(rnd.randint(1, MAX_SAMPLES))]
+        readings.append(("%016X" % rnd.getrandbits(64), samples))
+    return readings
+
+
+def check_round_trip(rnd, iterations):
+    encoder = FrameEncoder()
+    for _ in range(iterations):
+        readings = random_readings(rnd, rnd.randint(1, 8))
+        header = dict(request_id=rnd.randrange(0x10000), source_hopcount=rnd.randrange(256),
+                      hopcount=rnd.randrange(256), dtype=rnd.randrange(16))
+        stream = encoder.encode_data(readings, **header)
+
+        proto = MIFrameProtocol(Sink())
+        proto.buffer[:len(stream)] = stream
+        proto.end = len(stream)
+        frames = proto.extract_frames()
+        if len(frames) != len(readings):
+            raise Failure(f"framed {len(frames)} of {len(readings)} frames: {stream.hex()}")
+
+        for (length, raw), (mac, samples) in zip(frames, readings):
+            msg = Message.from_raw(Message.MESH_INDICATION, length, raw, 0.0)
+            got = (msg.addr.decode(), msg.request_id, msg.source_hopcount, msg.hopcount, msg.dtype)
+            if got != (mac, header["request_id"], header["source_hopcount"], header["hopcount"], header["dtype"]):
+                raise Failure(f"header {got} from {bytes(raw).hex()}")
+            if msg.commands[0].samples.tuples() != samples:
+                raise Failure(f"samples {msg.commands[0].samples.tuples()} != {samples}")
+            if msg.decompile() != bytes(raw):
+                raise Failure(f"decompile {msg.decompile().hex()} != {bytes(raw).hex()}")
+
+
+def mutate(rnd, data):
+    data = bytearray(data)
+    for _ in range(rnd.randint(1, 4)):
+        op = rnd.randrange(4)
+        if op == 0 and data:
+            data[rnd.randrange(len(data))] ^= 1 << rnd.randrange(8)
+        elif op == 1 and data:
+            del data[rnd.randrange(len(data)):]
+        elif op == 2:
+            pos = rnd.randint(0, len(data))
+            data[pos:pos] = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(1, 32)))
+        else:
+            pos = rnd.randint(0, len(data))
+            data[pos:pos] = MI_HEADER + bytes([rnd.randrange(256)])
+    return bytes(data)
+
+
+def check_malformed(rnd, iterations):
+    valid = mi_stream(make_panel_frames(16, 4, seed=rnd.randrange(1 << 30)))
+    for _ in range(iterations):
+        data = mutate(rnd, valid) if rnd.random() < 0.8 else bytes(rnd.getrandbits(8) for _ in range(512))
+        try:
+            feed(data, chunk=rnd.randint(1, 512), check_crc=rnd.random() < 0.5)
+        except Exception as e:
+            raise Failure(f"framing raised {e!r} on {data.hex()}")
+
+        raw = data[:rnd.randint(0, len(data))]
+        try:
+            Message.from_raw(Message.MESH_INDICATION, len(raw), raw, 0.0).commands
+        except (ValueError, struct.error):
+            pass
+        except Exception as e:
+            raise Failure(f"from_raw raised {e!r} on {raw.hex()}")
+
+
+ADVERSARIAL = {
+    "junk": lambda n: b"\x00" * n,
+    "M runs": lambda n: b"M" * n,
+    "short headers": lambda n: b"MI\x00" * (n // 3),
+    "truncated frames": lambda n: (MI_HEADER + b"\xff" + bytes(100)) * (n // 103),
+    "empty commands": lambda n: bytes(Message.HEADER_LEN) + b"\x00" * n,
+}
+
+
+def check_linear(base=16384, factor=16, steps=5, max_slope=1.3):
+    """
+    Time each adversarial input at ``steps`` sizes from ``base`` to
+    ``base * factor`` bytes and fit the slope of log time against log size:
+    1 for linear cost, 2 for quadratic. A slope above ``max_slope`` fails.
+    """
+    def cost(data):
+        # without the collector, whose passes grow with the objects a large
+        # input leaves alive, as timeit does
+        best = None
+        with quiet():
+            for _ in range(3):
+                gc.collect()
+                gc.disable()
+                try:
+                    start = time.perf_counter()
+                    feed(data, chunk=4096)
+                    Message.from_raw(Message.MESH_INDICATION, len(data), data, 0.0).commands
+                    elapsed = time.perf_counter() - start
+                finally:
+                    gc.enable()
+                best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    sizes = [round(base * factor ** (step / (steps - 1))) for step in range(steps)]
+    for name, make in ADVERSARIAL.items():
+        times = [cost(make(size)) for size in sizes]
+        slope = statistics.linear_regression([math.log(size) for size in sizes],
+                                             [math.log(max(t, 1e-9)) for t in times]).slope
+        print(f"{name:<20} {sizes[0]:>8} B {times[0] * 1000:>8.2f} ms   {sizes[-1]:>8} B {times[-1] * 1000:>8.2f} ms"
+              f"   slope {slope:.2f} (linear: 1)")
+        if slope > max_slope:
+            raise Failure(f"{name}: time grows as size^{slope:.2f} over {sizes[0]}..{sizes[-1]} bytes")
+
+
+def fuzz(args):
+    rnd = random.Random(args.seed)
+    try:
+        # malformed payloads make the parsers log a traceback each
+        with quiet():
+            check_round_trip(rnd, args.iterations)
+            check_malformed(rnd, args.iterations)
+        print(f"round trip, malformed: {args.iterations} iterations each passed (seed {args.seed})")
+        check_linear()
+    except Failure as e:
+        print(f"FAIL (seed {args.seed}): {e}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mix", dest="mixes", action="append", choices=list(MIXES),
+                        help="payload mix to run (repeatable; default all)")
+    parser.add_argument("--fuzz", action="store_true", help="run the property checks instead")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=random.randrange(1 << 30))
+    args = parser.parse_args()
+    args.mixes = args.mixes or list(MIXES)
+
+    if args.fuzz:
+        fuzz(args)
+    else:
+        throughput(args)
+
+
+if __name__ == "__main__":
+    main()
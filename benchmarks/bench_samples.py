@@ -0,0 +1,52 @@
+"""
+DataIndication sample decode speed, per-sample struct loop vs one bulk
+NumPy pass over many frames.
+
+before: each 14-byte sample is unpacked with ``struct.unpack(">Hhhhhhh")``
+        into a dict of seven values (the pre-NumPy DataIndication.parse).
+after:  decode_samples() joins the sample regions of every frame and decodes
+        them with one ``numpy.frombuffer`` over a structured dtype.
+"""
+
+import argparse
+import struct
+
+from DAQ.commands.protocol import Message
+from DAQ.commands.samples import STATUS_LEN, decode_samples
+from benchmarks.common import make_panel_frames, quiet, report, timed
+
+
+def legacy_decode(regions):
+    rows = []
+    for region in regions:
+        for i in range(0, len(region) - 13, 14):
+            timestamp, Vi, Vo, Ii, Io, Pi, Po = struct.unpack(">Hhhhhhh", region[i:i + 14])
+            rows.append({'timestamp': timestamp, 'Vi': Vi / 100.0, 'Vo': Vo / 100.0, 'Ii': Ii / 100.0,
+                         'Io': Io / 100.0, 'Pi': Pi / 100.0, 'Po': Po / 100.0})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with quiet():
+        frames = make_panel_frames(args.panels, args.samples)
+        commands = [Message.from_raw(Message.MESH_INDICATION, len(raw), raw, 0.0).commands[0] for raw in frames]
+    regions = [bytes(cmd.raw[STATUS_LEN:]) for cmd in commands]
+    macs = [cmd.header.addr for cmd in commands]
+    count = args.panels * args.samples
+
+    t_before = timed(legacy_decode, regions, repeat=args.repeat)
+    t_after = timed(decode_samples, regions, macs, repeat=args.repeat)
+
+    r_before = report("struct.unpack per sample", count, t_before, "samples")
+    r_after = report("numpy.frombuffer bulk", count, t_after, "samples")
+    print(f"speedup: {r_after / r_before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+TimerWheel cost with many outstanding timers, on a simulated clock.
+
+``--timers`` timeouts spread over ``--horizon`` seconds (think command TTLs,
+route expiry and staleness checks of a large fleet) are scheduled, a quarter
+are cancelled, and the wheel is advanced one tick at a time until all have
+fired. The run is repeated with ``levels=1``, a single hashed wheel that
+revisits far-off timers once per rotation, and with the hierarchical default.
+
+schedule: timers scheduled per second
+cancel:   timers cancelled per second
+advance:  CPU per tick while the timers drain, and the number of timer
+          visits (fired + re-placed) it took
+"""
+
+import argparse
+import random
+import time
+
+from DAQ.util.timers import TimerWheel
+from benchmarks.common import report
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(levels, n, horizon, slots, seed=7):
+    rnd = random.Random(seed)
+    delays = [rnd.uniform(1.0, horizon) for _ in range(n)]
+    clock = Clock()
+    wheel = TimerWheel(1.0, slots, levels, clock=clock)
+    callback = lambda: None
+
+    start = time.perf_counter()
+    timers = [wheel.schedule(delay, callback) for delay in delays]
+    t_schedule = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for timer in timers[::4]:
+        timer.cancel()
+    t_cancel = time.perf_counter() - start
+
+    visits = {"replaced": 0}
+    insert = wheel._insert
+
+    def counted(timer):
+        visits["replaced"] += 1
+        insert(timer)
+    wheel._insert = counted
+
+    ticks = int(horizon) + 2
+    start = time.perf_counter()
+    for _ in range(ticks):
+        clock.now += 1.0
+        wheel.advance()
+    t_advance = time.perf_counter() - start
+    assert not len(wheel) and wheel.fired == n - len(timers[::4]), (len(wheel), wheel.fired)
+
+    label = f"levels={levels}"
+    report(f"{label} schedule", n, t_schedule, "timers")
+    report(f"{label} cancel", len(timers[::4]), t_cancel, "timers")
+    report(f"{label} advance", ticks, t_advance, "ticks")
+    print(f"{'':<40} {t_advance / ticks * 1e6:.1f} us/tick, "
+          f"{wheel.fired + visits['replaced']} visits for {wheel.fired} fired")
+    return t_advance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timers", type=int, default=100000)
+    parser.add_argument("--horizon", type=float, default=86400.0, help="seconds the delays are spread over")
+    parser.add_argument("--slots", type=int, default=512)
+    args = parser.parse_args()
+
+    flat = run(1, args.timers, args.horizon, args.slots)
+    hierarchical = run(4, args.timers, args.horizon, args.slots)
+    print(f"{'':<40} advance speedup: {flat / hierarchical:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
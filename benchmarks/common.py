@@ -0,0 +1,88 @@
+"""
+Shared helpers for the offline benchmarks.
+
+Run a benchmark from the repository root, e.g.::
+
+    python -m benchmarks.bench_ingest --panels 5000
+"""
+
+import contextlib
+import io
+import logging
+import random
+import time
+
+from DAQ.commands.protocol import Message, DataIndication
+
+
+def panel_macs(n_panels, seed=7):
+    rnd = random.Random(seed)
+    return ["%016X" % rnd.getrandbits(64) for _ in range(n_panels)]
+
+
+def make_panel_frame(macaddr, samples=1, timestamp=0, rnd=random):
+    msg = Message()
+    msg.set_addr(macaddr)
+    msg.source_hopcount = rnd.randint(1, 10)
+    msg.dtype = Message.TYPE_PLM
+
+    cmd = DataIndication()
+    for i in range(samples):
+        Vi = rnd.uniform(38.0, 40.0)
+        Ii = rnd.uniform(7.0, 8.0)
+        cmd.add_data(timestamp + i, Vi, Vi, Ii, Ii, Vi * Ii / 10.0, Vi * Ii / 10.0)
+    msg.add_command(cmd)
+
+    return msg.decompile()
+
+
+def make_panel_frames(n_panels, samples=1, seed=7):
+    """One MI payload (header + DataIndication) per panel."""
+    rnd = random.Random(seed)
+    with quiet():
+        return [make_panel_frame(mac, samples, rnd.randrange(0, 0xFFFE - samples), rnd)
+                for mac in panel_macs(n_panels, seed)]
+
+
+def number_frames(payloads):
+    """Give every payload its own request id, so repeated rounds are not retransmissions."""
+    numbered = []
+    for i, payload in enumerate(payloads):
+        frame = bytearray(payload)
+        frame[9:11] = (i & 0xFFFF).to_bytes(2, "big")
+        numbered.append(bytes(frame))
+    return numbered
+
+
+def mi_stream(payloads):
+    """Join payloads into a ``MI<len><payload>`` byte stream."""
+    return b"".join(b"MI" + bytes([len(p)]) + p for p in payloads)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the protocol module's per-frame warnings (and any stdout chatter) while timing."""
+    logger = logging.getLogger("protocol")
+    disabled, logger.disabled = logger.disabled, True
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logger.disabled = disabled
+
+
+def timed(fn, *args, repeat=3):
+    """Best wall-clock time of ``repeat`` runs of ``fn(*args)``."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(name, count, seconds, unit="frames"):
+    rate = count / seconds if seconds else float("inf")
+    print(f"{name:<40} {count:>8} {unit} {seconds * 1000:>10.1f} ms {rate:>14,.0f} {unit}/s")
+    return rate
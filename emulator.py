@@ -1,11 +1,12 @@
 import asyncio
 import random
 import socket
-from DAQ.commands.protocol import Message, DataIndication
+from DAQ.commands.protocol import Message
 from DAQ.util.utctime import utcepochnow
 from DAQ.util.config import load_config
 from DAQ.mesh.simulator import MonitorSimulator
 from DAQ.util.faults import get_fault, reset_fault  # ✅ Fault injection support
+from DAQ.gateway.encoder import FrameEncoder
 
 cfg = load_config()
 
@@ -14,6 +15,7 @@ comm_port = cfg['gateway']['comm_port']
 ad_listen_port = cfg['gateway']['ad_listen_port']
 ad_respond_port = cfg['gateway']['ad_respond_port']
 ad_host = cfg['gateway']['ad_host']
+frame_crc = cfg['gateway'].get('frame_crc', False)
 
 panel_delay = cfg['emulator'].get('panel_delay', 0.25)
 cycle_delay = cfg['emulator'].get('cycle_delay', 0.5)
@@ -70,6 +72,7 @@ class AsyncEmulator:
         self.start_time = utcepochnow()
         self.reader = None
         self.writer = None
+        self.encoder = FrameEncoder(with_crc=frame_crc)
 
     async def find_siteserver(self):
         loop = asyncio.get_running_loop()
@@ -105,52 +108,54 @@ class AsyncEmulator:
         self.reader, self.writer = await asyncio.open_connection(host, comm_port)
         print(f"[EMULATOR] Connected.")
 
-    async def send_status_message(self, macaddr):
-        profile = generate_profile(macaddr)
-        Vi = profile["voltage"]
-        Ii = profile["current"]
-        Pi = profile["power"]
+    async def send_status_messages(self, macaddrs):
+        """Encode one reading per MAC into a single MI stream and write it in one go."""
+        readings, sent = [], []
         timestamp = utcepochnow() - self.start_time
 
-        msg = Message()
-        try:
-            if isinstance(macaddr, bytes):
-                macaddr = macaddr.decode("utf-8")
-            elif not isinstance(macaddr, str):
-                macaddr = str(macaddr)
-            mac_clean = macaddr.replace(":", "").strip().lower()
-            if len(mac_clean) != 12:
-                print(f"[ERROR] MAC {mac_clean} is not 6 bytes")
-                return
-            msg.set_addr(mac_clean)
-        except Exception as e:
-            print(f"[ERROR] Invalid MAC '{macaddr}': {e}")
-            return
-
-        msg.source_hopcount = random.randint(1, 10)
-        msg.source_queue_length = 0
-        msg.dtype = Message.TYPE_PLM
-
-        cmd = DataIndication()
-        cmd.add_data(timestamp, Vi, Vi, Ii, Ii, Pi, Pi)
-        msg.add_command(cmd)
-
-        payload = msg.decompile()
+        for macaddr in macaddrs:
+            try:
+                if isinstance(macaddr, bytes):
+                    macaddr = macaddr.decode("utf-8")
+                elif not isinstance(macaddr, str):
+                    macaddr = str(macaddr)
+                mac_clean = macaddr.replace(":", "").strip().lower()
+                if len(mac_clean) != 12:
+                    print(f"[ERROR] MAC {mac_clean} is not 6 bytes")
+                    continue
+            except Exception as e:
+                print(f"[ERROR] Invalid MAC '{macaddr}': {e}")
+                continue
 
-        print(f"[DEBUG] Decompile length: {len(payload)}")
-        print(f"[DEBUG] Decompile hex: {payload.hex()}")
+            profile = generate_profile(macaddr)
+            Vi = profile["voltage"]
+            Ii = profile["current"]
+            Pi = profile["power"]
+            readings.append((mac_clean, [(timestamp, Vi, Vi, Ii, Ii, Pi, Pi)]))
+            sent.append((mac_clean, Vi, Ii, Pi))
 
-        if len(payload) > 255:
-            print(f"[SKIP] Payload too large: {len(payload)} bytes")
+        if not readings:
             return
 
-        message = b"MI" + bytes([len(payload)]) + payload
-        print(f"[DEBUG] Final message hex: {message.hex()}")
+        self.encoder.reset()
+        for mac_clean, samples in readings:
+            try:
+                self.encoder.add_data_indication(mac_clean, samples, source_hopcount=random.randint(1, 10),
+                                                 dtype=Message.TYPE_PLM)
+            except ValueError as e:
+                print(f"[SKIP] {mac_clean}: {e}")
+        stream = self.encoder.getvalue()
+
+        print(f"[DEBUG] Encoded {len(readings)} frames, {len(stream)} bytes")
 
-        self.writer.write(message)
+        self.writer.write(stream)
         await self.writer.drain()
 
-        print(f"[EMULATOR] Sent: MAC={mac_clean}  V={Vi:.2f} I={Ii:.2f} P={Pi:.2f}")
+        for mac_clean, Vi, Ii, Pi in sent:
+            print(f"[EMULATOR] Sent: MAC={mac_clean}  V={Vi:.2f} I={Ii:.2f} P={Pi:.2f}")
+
+    async def send_status_message(self, macaddr):
+        await self.send_status_messages([macaddr])
 
     async def run(self):
         siteserver_host = await self.find_siteserver()
@@ -162,9 +167,12 @@ class AsyncEmulator:
 
         try:
             while True:
-                for mac in PANEL_MACS:
-                    await self.send_status_message(mac)
-                    await asyncio.sleep(panel_delay)
+                if panel_delay:
+                    for mac in PANEL_MACS:
+                        await self.send_status_message(mac)
+                        await asyncio.sleep(panel_delay)
+                else:
+                    await self.send_status_messages(PANEL_MACS)
                 await asyncio.sleep(cycle_delay)
         except asyncio.CancelledError:
             print("[EMULATOR] Cancelled.")